@@ -1,21 +1,38 @@
-from flask import Flask, render_template
+import os
+from flask import Flask, redirect, url_for
+from dotenv import load_dotenv
 from routes import weather
-from routes import test
-from routes import forecast
+from utls.main import start_forecast_refresher
+from utls.http_cache import init_http_caching
+from utls.metrics import init_flask_metrics
 
-def create_app():
-    app = Flask(__name__)
+load_dotenv()
 
-    app.register_blueprint(weather.bp)
-    app.register_blueprint(test.bp)
-    app.register_blueprint(forecast.bp)
+# WEB_DASHBOARD=0 — только API (/weather/...): без Dash и Plotly процесс стартует быстрее
+WEB_DASHBOARD = os.getenv("WEB_DASHBOARD", "1").lower() in ("1", "true", "yes")
 
-    return app
+# Шаблоны лежат в корне проекта, а не рядом с этим модулем
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-app = create_app()
+def create_app(dashboard=WEB_DASHBOARD):
+    """
+    Единое приложение: blueprint погоды, метрики и, если включён, дашборд Dash на том же сервере.
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+    Кэши локаций и прогнозов общие для всех воркеров при CACHE_BACKEND=sqlite (см. utls.cache).
+    """
+    app = Flask(__name__, root_path=ROOT_PATH)
+    app.register_blueprint(weather.bp)
+    init_flask_metrics(app)
+    init_http_caching(app)
 
+    if dashboard:
+        # Dash, dash_leaflet и Plotly загружаются только здесь
+        from dashboard import init_dashboard
+        init_dashboard(app)
+    else:
+        app.add_url_rule('/', 'index', lambda: redirect(url_for('weather.weather_route')))
+
+    # Популярные прогнозы обновляются в фоне, чтобы пользователи попадали в кэш
+    start_forecast_refresher()
+    return app
@@ -0,0 +1,288 @@
+"""
+Локальная заглушка AccuWeather для нагрузочных тестов.
+
+Отдаёт ответы того же вида, что и настоящий API, для cities/search,
+cities/geoposition/search, forecasts/v1/daily/5day и currentconditions.
+Задержку, долю ошибок и квоту можно настроить. Приложение направляется на
+заглушку переменной окружения ACCUWEATHER_BASE_URL:
+
+    python bench/fake_accuweather.py --port 8081 --latency 0.2 --error-rate 0.01
+    ACCUWEATHER_BASE_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utls.gazetteer import Gazetteer, GAZETTEER_FILE  # noqa: E402
+
+
+class FakeConfig:
+    """
+    Поведение заглушки.
+
+    Args:
+        latency (float): Базовая задержка ответа в секундах.
+        jitter (float): Случайная добавка к задержке, от 0 до jitter секунд.
+        slow_rate (float): Доля очень медленных ответов (хвост распределения).
+        slow_latency (float): Задержка медленного ответа в секундах.
+        error_rate (float): Доля ответов 500.
+        quota (int): Сколько запросов обслужить до ответов 503, как при исчерпанной квоте; 0 — без лимита.
+        max_age (int): Значение Cache-Control: max-age для прогнозов.
+    """
+
+    def __init__(self, latency=0.1, jitter=0.05, slow_rate=0.0, slow_latency=2.0,
+                 error_rate=0.0, quota=0, max_age=1800):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.quota = quota
+        self.max_age = max_age
+
+
+def _key(text):
+    return str(zlib.crc32(text.encode("utf-8")) % 1000000)
+
+
+def _location(key, name, latitude, longitude):
+    return {
+        "Key": key,
+        "LocalizedName": name,
+        "GeoPosition": {"Latitude": latitude, "Longitude": longitude},
+    }
+
+
+def _value(value, unit, unit_type):
+    return {"Value": value, "Unit": unit, "UnitType": unit_type}
+
+
+def _half_day(rng, precipitation):
+    # Половина суток в том же виде, что у настоящего API с details=true
+    phrase = "Облачно с прояснениями"
+    return {
+        "Icon": rng.randint(1, 44),
+        "IconPhrase": phrase,
+        "HasPrecipitation": precipitation,
+        "ShortPhrase": phrase,
+        "LongPhrase": f"{phrase}, временами ветрено",
+        "PrecipitationProbability": rng.randint(0, 100),
+        "ThunderstormProbability": rng.randint(0, 40),
+        "RainProbability": rng.randint(0, 100),
+        "SnowProbability": rng.randint(0, 30),
+        "IceProbability": rng.randint(0, 10),
+        "Wind": {
+            "Speed": _value(round(rng.uniform(0, 60), 1), "km/h", 7),
+            "Direction": {"Degrees": rng.randint(0, 359), "Localized": "СЗ", "English": "NW"},
+        },
+        "WindGust": {
+            "Speed": _value(round(rng.uniform(10, 90), 1), "km/h", 7),
+            "Direction": {"Degrees": rng.randint(0, 359), "Localized": "З", "English": "W"},
+        },
+        "TotalLiquid": _value(round(rng.uniform(0, 10), 1), "mm", 3),
+        "Rain": _value(round(rng.uniform(0, 10), 1), "mm", 3),
+        "Snow": _value(0.0, "cm", 4),
+        "Ice": _value(0.0, "mm", 3),
+        "HoursOfPrecipitation": round(rng.uniform(0, 6), 1),
+        "HoursOfRain": round(rng.uniform(0, 6), 1),
+        "HoursOfSnow": 0.0,
+        "HoursOfIce": 0.0,
+        "CloudCover": rng.randint(0, 100),
+        "Evapotranspiration": _value(round(rng.uniform(0, 3), 1), "mm", 3),
+        "SolarIrradiance": _value(round(rng.uniform(0, 3000), 1), "W/m²", 33),
+        "RelativeHumidity": {"Minimum": rng.randint(20, 60), "Maximum": rng.randint(60, 100),
+                             "Average": rng.randint(40, 80)},
+    }
+
+
+def _daily_forecast(key):
+    rng = random.Random(key)
+    start = date.today()
+    days = []
+    for i in range(5):
+        day = start + timedelta(days=i)
+        low = round(rng.uniform(-15, 20), 1)
+        high = round(low + rng.uniform(2, 12), 1)
+        days.append({
+            "Date": f"{day:%Y-%m-%d}T07:00:00+03:00",
+            "EpochDate": 1700000000 + 86400 * i,
+            "Sun": {"Rise": f"{day:%Y-%m-%d}T07:12:00+03:00", "EpochRise": 1700000000 + 86400 * i,
+                    "Set": f"{day:%Y-%m-%d}T17:40:00+03:00", "EpochSet": 1700037000 + 86400 * i},
+            "Moon": {"Rise": f"{day:%Y-%m-%d}T13:05:00+03:00", "EpochRise": 1700020000 + 86400 * i,
+                     "Set": f"{day:%Y-%m-%d}T23:51:00+03:00", "EpochSet": 1700059000 + 86400 * i,
+                     "Phase": "WaxingGibbous", "Age": 10 + i},
+            "Temperature": {"Minimum": _value(low, "C", 17), "Maximum": _value(high, "C", 17)},
+            "RealFeelTemperature": {
+                "Minimum": {**_value(round(low - 3, 1), "C", 17), "Phrase": "Холодно"},
+                "Maximum": {**_value(round(high - 1, 1), "C", 17), "Phrase": "Прохладно"},
+            },
+            "RealFeelTemperatureShade": {
+                "Minimum": {**_value(round(low - 3, 1), "C", 17), "Phrase": "Холодно"},
+                "Maximum": {**_value(round(high - 2, 1), "C", 17), "Phrase": "Прохладно"},
+            },
+            "HoursOfSun": round(rng.uniform(0, 10), 1),
+            "DegreeDaySummary": {"Heating": _value(rng.randint(0, 30), "C", 17), "Cooling": _value(0, "C", 17)},
+            "AirAndPollen": [
+                {"Name": name, "Value": rng.randint(0, 60), "Category": "Хорошо", "CategoryValue": 1}
+                for name in ("AirQuality", "Grass", "Mold", "Ragweed", "Tree", "UVIndex")
+            ],
+            "Day": _half_day(rng, rng.random() < 0.3),
+            "Night": _half_day(rng, rng.random() < 0.3),
+            "Sources": ["AccuWeather"],
+            "MobileLink": f"http://www.accuweather.com/ru/forecast/{key}?day={i + 1}&unit=c&lang=ru",
+            "Link": f"http://www.accuweather.com/ru/forecast/{key}?day={i + 1}&unit=c&lang=ru",
+        })
+    return {
+        "Headline": {
+            "EffectiveDate": f"{start:%Y-%m-%d}T07:00:00+03:00", "EffectiveEpochDate": 1700000000,
+            "Severity": 4, "Text": "Прогноз заглушки", "Category": "rain",
+            "EndDate": None, "EndEpochDate": None,
+            "MobileLink": f"http://www.accuweather.com/ru/forecast/{key}?unit=c&lang=ru",
+            "Link": f"http://www.accuweather.com/ru/forecast/{key}?unit=c&lang=ru",
+        },
+        "DailyForecasts": days,
+    }
+
+
+def _current_conditions(key):
+    rng = random.Random(f"{key}:now")
+    return [{
+        "WeatherText": "Облачно",
+        "HasPrecipitation": rng.random() < 0.3,
+        "IsDayTime": True,
+        "Temperature": {"Metric": {"Value": round(rng.uniform(-10, 30), 1), "Unit": "C"}},
+        "RelativeHumidity": rng.randint(20, 90),
+        "Wind": {"Speed": {"Metric": {"Value": round(rng.uniform(0, 60), 1), "Unit": "km/h"}}},
+        "Visibility": {"Metric": {"Value": round(rng.uniform(1, 30), 1), "Unit": "km"}},
+        "Link": f"http://www.accuweather.com/ru/current-weather/{key}",
+    }]
+
+
+def create_fake_app(config=None):
+    config = config or FakeConfig()
+    app = Flask(__name__)
+    app.config["FAKE"] = config
+    app.config["FAKE_STATS"] = stats = {"requests": 0, "errors": 0, "quota_exceeded": 0, "not_modified": 0}
+    lock = threading.Lock()
+
+    cities = Gazetteer()
+    try:
+        cities.load_csv(GAZETTEER_FILE)
+    except OSError:
+        pass
+
+    @app.before_request
+    def simulate():
+        with lock:
+            stats["requests"] += 1
+            served = stats["requests"]
+        delay = config.latency + random.uniform(0, config.jitter)
+        if config.slow_rate and random.random() < config.slow_rate:
+            delay = config.slow_latency
+        time.sleep(delay)
+        if config.quota and served > config.quota:
+            with lock:
+                stats["quota_exceeded"] += 1
+            return jsonify(Code="ServiceUnavailable",
+                           Message="The allowed number of requests has been exceeded."), 503
+        if config.error_rate and random.random() < config.error_rate:
+            with lock:
+                stats["errors"] += 1
+            return jsonify(Code="InternalServerError", Message="Fake upstream error"), 500
+        return None
+
+    @app.route("/locations/v1/cities/search")
+    def city_search():
+        query = request.args.get("q", "").strip()
+        if not query:
+            return jsonify([])
+        entry = cities.lookup(query)
+        if entry is not None:
+            return jsonify([_location(entry["key"] or _key(entry["name"]), entry["name"],
+                                      entry["latitude"], entry["longitude"])])
+        # Неизвестные города тоже находятся, чтобы нагрузку можно было давать любыми названиями
+        rng = random.Random(query.lower())
+        return jsonify([_location(_key(query.lower()), query.title(),
+                                  round(rng.uniform(41, 70), 4), round(rng.uniform(20, 140), 4))])
+
+    @app.route("/locations/v1/cities/geoposition/search")
+    def geoposition_search():
+        try:
+            latitude, longitude = (float(value) for value in request.args.get("q", "").split(","))
+        except ValueError:
+            return jsonify(Code="BadRequest", Message="Invalid q"), 400
+        # Одна «локация» на клетку 0.1° — как населённый пункт рядом с точкой
+        latitude, longitude = round(latitude, 1), round(longitude, 1)
+        return jsonify(_location(_key(f"{latitude},{longitude}"), f"Пункт {latitude:.1f} {longitude:.1f}",
+                                 latitude, longitude))
+
+    @app.route("/forecasts/v1/daily/5day/<location_key>")
+    def daily_forecast(location_key):
+        response = jsonify(_daily_forecast(location_key))
+        response.headers["Cache-Control"] = f"max-age={config.max_age}"
+        # Как у настоящего API: ETag по содержимому и 304 на условный запрос
+        response.add_etag()
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            with lock:
+                stats["not_modified"] += 1
+        return response
+
+    @app.route("/currentconditions/v1/<location_key>")
+    def current_conditions(location_key):
+        return jsonify(_current_conditions(location_key))
+
+    return app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    # Журнал каждого запроса заглушки заглушил бы вывод нагрузочного теста
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve_in_thread(config=None, host="127.0.0.1", port=0):
+    """
+    Запускает заглушку в фоновом потоке.
+
+    Returns:
+        tuple: (server, base_url); server.shutdown() останавливает заглушку.
+    """
+    server = make_server(host, port, create_fake_app(config), threaded=True, request_handler=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name="fake-accuweather", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.1, help="базовая задержка, с")
+    parser.add_argument("--jitter", type=float, default=0.05, help="случайная добавка к задержке, с")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="доля медленных ответов")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="задержка медленного ответа, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--quota", type=int, default=0, help="запросов до ответов 503 (0 — без лимита)")
+    parser.add_argument("--max-age", type=int, default=1800, help="Cache-Control: max-age прогнозов, с")
+
+
+def config_from_args(args):
+    return FakeConfig(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                      slow_latency=args.slow_latency, error_rate=args.error_rate,
+                      quota=args.quota, max_age=args.max_age)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка AccuWeather")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args()
+    create_fake_app(config_from_args(args)).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,112 @@
+"""
+Время импорта точек входа: сколько стоит холодный старт воркера или бота.
+
+Каждая точка входа импортируется в отдельном чистом процессе несколько раз;
+печатается лучшее и медианное время и самые дорогие модули по -X importtime.
+Тяжёлые зависимости, которых точка входа не должна загружать при старте,
+проверяются явно — при регрессии скрипт завершается с кодом 1:
+
+    python bench/import_time.py
+    python bench/import_time.py --target api --repeat 10 --budget 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.load import _prepare_environment  # noqa: E402
+
+# Точка входа -> (модуль, переменные окружения, модули, которых не должно быть после импорта)
+TARGETS = {
+    "api": ("main", {"WEB_DASHBOARD": "0"}, ("pandas", "dash", "dash_leaflet", "plotly")),
+    "dashboard": ("main", {"WEB_DASHBOARD": "1"}, ("pandas",)),
+    "bot": ("tg_bot", {}, ("pandas", "dash", "plotly", "flask")),
+    "routes": ("routes.weather", {}, ("pandas", "dash", "plotly")),
+}
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _heaviest_packages(stderr, module, top):
+    # Строки вида "import time:       self |  cumulative | <отступ>модуль"; у вложенных
+    # импортов cumulative включает время детей, поэтому берём только пакеты верхнего уровня
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." in name or name == module.split(".")[0]:
+            continue
+        rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure(module, env, repeat):
+    """
+    Returns:
+        tuple: (список времён в секундах, модули после импорта, строки -X importtime последнего запуска)
+    """
+    times = []
+    modules = []
+    stderr = ""
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"импорт {module} завершился с ошибкой:\n{result.stderr[-2000:]}")
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(probe["seconds"])
+        modules = probe["modules"]
+        stderr = result.stderr
+    return times, modules, stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта точек входа")
+    parser.add_argument("--target", action="append", choices=sorted(TARGETS),
+                        help="точка входа (можно несколько); по умолчанию все")
+    parser.add_argument("--repeat", type=int, default=5, help="запусков на точку входа")
+    parser.add_argument("--top", type=int, default=8, help="сколько самых дорогих модулей показать")
+    parser.add_argument("--budget", type=float, help="максимум медианного времени импорта, с")
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix="weather-bench-")
+    _prepare_environment(state_dir)
+
+    failed = False
+    for target in args.target or TARGETS:
+        module, extra_env, forbidden = TARGETS[target]
+        env = dict(os.environ, **extra_env)
+        times, modules, stderr = measure(module, env, args.repeat)
+        median = statistics.median(times)
+        print(f"{target:<10} {module:<16} лучшее {min(times) * 1000:7.0f} мс  медиана {median * 1000:7.0f} мс")
+        for cumulative_us, name in _heaviest_packages(stderr, module, args.top):
+            print(f"    {cumulative_us / 1000:8.1f} мс  {name}")
+
+        loaded = [name for name in forbidden if name in modules]
+        if loaded:
+            failed = True
+            print(f"    РЕГРЕССИЯ: при импорте загружены {', '.join(loaded)}")
+        if args.budget is not None and median > args.budget:
+            failed = True
+            print(f"    РЕГРЕССИЯ: медиана больше {args.budget} с")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Нагрузочный тест веб-приложения и бота против заглушки AccuWeather.
+
+Поднимает bench/fake_accuweather.py в фоне (или использует уже запущенную через
+--upstream), направляет на неё приложение через ACCUWEATHER_BASE_URL и гоняет
+сценарии с заданной параллельностью. Для каждого сценария печатает число
+запросов, ошибки, пропускную способность и p50/p95/p99.
+
+    python bench/load.py --scenario route --scenario bot --requests 500 --concurrency 32
+    python bench/load.py --url http://127.0.0.1:8000 --scenario route   # уже запущенное приложение
+
+Сценарии:
+    route        POST /weather/route
+    dash-layout  GET /dash/_dash-layout (первая отрисовка графика)
+    dash-map     колбэк карты add_route_and_markers
+    bot          обработчик process_duration бота (только в процессе)
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ("route", "dash-layout", "dash-map", "bot")
+
+DASH_MAP_CALLBACK = {
+    "output": "..markers-layer.children...route-line.positions...samples-layer.children..",
+    "outputs": [
+        {"id": "markers-layer", "property": "children"},
+        {"id": "route-line", "property": "positions"},
+        {"id": "samples-layer", "property": "children"},
+    ],
+    "inputs": [{"id": "map", "property": "id", "value": "map"}],
+    "changedPropIds": [],
+    "state": [],
+}
+
+
+def _prepare_environment(state_dir):
+    # Вызывается до импорта модулей приложения: они читают настройки при импорте.
+    # Лимиты планировщика квоты снимаем: ограничивает только заглушка (--quota)
+    os.environ.setdefault("API_KEY", "bench")
+    os.environ.setdefault("API_TOKEN", "123456:bench-token-aaaaaaaaaaaaaaaaaaaaaaaaa")
+    os.environ.setdefault("DAILY_QUOTA", str(10 ** 9))
+    os.environ.setdefault("QUOTA_RATE", str(10 ** 6))
+    os.environ.setdefault("QUOTA_BURST", str(10 ** 6))
+    os.environ.setdefault("QUOTA_STATE_FILE", os.path.join(state_dir, "quota_state.json"))
+    os.environ.setdefault("GAZETTEER_KEYS_FILE", os.path.join(state_dir, "gazetteer_keys.json"))
+    os.environ.setdefault("ROUTE_STORE_PATH", os.path.join(state_dir, "routes.sqlite3"))
+    os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(state_dir, "weather_cache.sqlite3"))
+    os.environ.setdefault("ARCHIVE_DIR", os.path.join(state_dir, "forecast_archive"))
+
+
+def _routes(count, seed):
+    from utls.gazetteer import GAZETTEER_FILE
+    import csv
+    with open(GAZETTEER_FILE, encoding="utf-8", newline="") as f:
+        names = [row["name"] for row in csv.DictReader(f)]
+    rng = random.Random(seed)
+    return [tuple(rng.sample(names, 2)) for _ in range(count)]
+
+
+def _clear_caches():
+    import utls.main
+    utls.main.location_cache.clear()
+    utls.main.forecast_cache.clear()
+    if "dashboard" in sys.modules:
+        sys.modules["dashboard"].figure_cache.clear()
+
+
+class _HttpClient:
+    """Тот же интерфейс, что у тестового клиента Flask, но по HTTP к запущенному приложению."""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def get(self, path, **kwargs):
+        return self.session.get(self.base_url + path, allow_redirects=False, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session.post(self.base_url + path, allow_redirects=False, **kwargs)
+
+
+def _make_client(url):
+    if url:
+        return _HttpClient(url)
+    import main
+    return main.app.test_client()
+
+
+def _route_request(client, start, end):
+    response = client.post("/weather/route", data={"start": start, "end": end})
+    # error.html тоже отдаётся с 200, поэтому отличаем её по содержимому
+    return response.status_code == 200 and "Лучший день" in _text(response)
+
+
+def _dash_layout_request(client, start, end):
+    client.post("/", data={"start_point": start, "end_point": end})
+    started = time.perf_counter()
+    response = client.get("/dash/_dash-layout")
+    return response.status_code == 200, time.perf_counter() - started
+
+
+def _dash_map_request(client, start, end):
+    client.post("/", data={"start_point": start, "end_point": end})
+    started = time.perf_counter()
+    response = client.post("/dash/_dash-update-component", json=DASH_MAP_CALLBACK)
+    return response.status_code == 200, time.perf_counter() - started
+
+
+def _text(response):
+    return response.text if hasattr(response, "text") else response.get_data(as_text=True)
+
+
+def run_sync(request_fn, routes, concurrency, url, cold):
+    """Гоняет request_fn(client, start, end) в concurrency потоках; у каждого потока свой клиент."""
+    local = threading.local()
+
+    def one(route):
+        if not hasattr(local, "client"):
+            local.client = _make_client(url)
+        if cold:
+            _clear_caches()
+        started = time.perf_counter()
+        try:
+            result = request_fn(local.client, *route)
+        except Exception as e:
+            print(f"Ошибка запроса: {e!r}")
+            return False, time.perf_counter() - started
+        if isinstance(result, tuple):
+            return result
+        return result, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        results = list(executor.map(one, routes))
+    return results, time.perf_counter() - started
+
+
+class _Message:
+    # Бот отвечает одним сообщением и дописывает его через edit_text; здесь это одно и то же сообщение
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+        return self
+
+
+class _CallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = _Message()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+class _State:
+    def __init__(self, data):
+        self._data = dict(data)
+
+    async def update_data(self, **kwargs):
+        self._data.update(kwargs)
+
+    async def get_data(self):
+        return dict(self._data)
+
+    async def clear(self):
+        self._data.clear()
+
+
+async def _run_bot(routes, concurrency, cold):
+    import tg_bot
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(route):
+        async with semaphore:
+            if cold:
+                _clear_caches()
+            callback = _CallbackQuery("5")
+            state = _State({"start_point": route[0], "end_point": route[1]})
+            started = time.perf_counter()
+            try:
+                await tg_bot.process_duration(callback, state)
+            except Exception as e:
+                print(f"Ошибка обработчика: {e!r}")
+                return False, time.perf_counter() - started
+            # Итог — последняя правка сообщения; без неё пользователь видел только заглушку
+            edits = callback.message.edits
+            ok = bool(edits) and "ошибка" not in edits[-1].lower()
+            return ok, time.perf_counter() - started
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(route) for route in routes))
+        return results, time.perf_counter() - started
+    finally:
+        await tg_bot.weather_client.close()
+
+
+def _percentile(values, q):
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, int(round(q * len(values))) - 1))
+    return values[index]
+
+
+def report(name, results, elapsed):
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for ok, _ in results if not ok)
+    print(
+        f"{name:<12} запросов {len(results):>6}  ошибок {errors:>5}  "
+        f"{len(results) / elapsed:8.1f} rps  "
+        f"p50 {_percentile(latencies, 0.50) * 1000:8.1f} мс  "
+        f"p95 {_percentile(latencies, 0.95) * 1000:8.1f} мс  "
+        f"p99 {_percentile(latencies, 0.99) * 1000:8.1f} мс"
+    )
+
+
+def main():
+    state_dir = tempfile.mkdtemp(prefix="weather-bench-")
+    _prepare_environment(state_dir)
+    from bench.fake_accuweather import add_arguments, config_from_args, serve_in_thread
+
+    parser = argparse.ArgumentParser(description="Нагрузочный тест маршрутов, Dash и бота")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="сценарий (можно несколько); по умолчанию все")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных запросов")
+    parser.add_argument("--routes", type=int, default=20, help="различных маршрутов в нагрузке")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cold", action="store_true", help="очищать кэши перед каждым запросом")
+    parser.add_argument("--url", help="адрес уже запущенного приложения вместо вызова в процессе")
+    parser.add_argument("--upstream", help="адрес уже запущенной заглушки AccuWeather")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.upstream
+    if base_url is None:
+        server, base_url = serve_in_thread(config_from_args(args))
+    os.environ["ACCUWEATHER_BASE_URL"] = base_url
+
+    pool = _routes(args.routes, args.seed)
+    rng = random.Random(args.seed)
+    routes = [rng.choice(pool) for _ in range(args.requests)]
+
+    print(f"Заглушка: {base_url}; состояние в {state_dir}")
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            if scenario == "bot":
+                if args.url:
+                    print("bot: сценарий работает только в процессе, пропущен")
+                    continue
+                results, elapsed = asyncio.run(_run_bot(routes, args.concurrency, args.cold))
+            else:
+                request_fn = {
+                    "route": _route_request,
+                    "dash-layout": _dash_layout_request,
+                    "dash-map": _dash_map_request,
+                }[scenario]
+                results, elapsed = run_sync(request_fn, routes, args.concurrency, args.url, args.cold)
+            report(scenario, results, elapsed)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
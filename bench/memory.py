@@ -0,0 +1,77 @@
+"""
+Память на один закэшированный прогноз: сырой JSON ответа против utls.records.Forecast.
+
+Прогнозы берутся в формате заглушки AccuWeather (bench/fake_accuweather.py,
+поля как у details=true) или из сохранённого настоящего ответа (--payload).
+Кэш заполняется так же, как это делает fetch_daily_forecast, а прирост памяти
+считается через tracemalloc:
+
+    python bench/memory.py --locations 20000
+    python bench/memory.py --payload saved_5day_response.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_accuweather import _daily_forecast  # noqa: E402
+from utls.cache import TTLCache  # noqa: E402
+from utls.records import Forecast  # noqa: E402
+
+
+def _responses(count, payload_file):
+    # Тексты ответов, как они приходят из сети; разбираются уже внутри замера
+    if payload_file:
+        with open(payload_file, encoding="utf-8") as f:
+            text = f.read()
+        return [text] * count
+    return [json.dumps(_daily_forecast(str(i)), ensure_ascii=False) for i in range(count)]
+
+
+def measure(responses, convert):
+    """
+    Returns:
+        tuple: (байт на запись в кэше, заполненный кэш).
+    """
+    cache = TTLCache(maxsize=len(responses), ttl=3600)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, text in enumerate(responses):
+        cache.set(str(i), convert(json.loads(text)))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / len(responses), cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на закэшированный прогноз")
+    parser.add_argument("--locations", type=int, default=5000, help="сколько прогнозов положить в кэш")
+    parser.add_argument("--payload", help="файл с настоящим ответом forecasts/v1/daily/5day")
+    parser.add_argument("--scale", type=int, default=50000, help="для какого размера кэша посчитать итог")
+    args = parser.parse_args()
+
+    responses = _responses(args.locations, args.payload)
+    print(f"Ответов: {len(responses)}, средний размер JSON {sum(map(len, responses)) / len(responses):.0f} символов")
+
+    results = []
+    for name, convert in (("сырой JSON", lambda payload: payload), ("Forecast", Forecast.from_payload)):
+        per_entry, cache = measure(responses, convert)
+        results.append(per_entry)
+        print(f"{name:<12} {per_entry:10.0f} байт на прогноз  "
+              f"{per_entry * args.scale / 2 ** 20:8.1f} МБ на {args.scale} локаций")
+        del cache
+
+    encoded = sum(len(json.dumps(Forecast.from_payload(json.loads(text)).to_json(), ensure_ascii=False))
+                  for text in responses[:100]) / min(len(responses), 100)
+    print(f"В SQLite (CACHE_BACKEND=sqlite): {encoded:.0f} символов на прогноз")
+    print(f"Экономия: в {results[0] / results[1]:.1f} раза")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Дашборд Dash с картой маршрута и графиком прогноза.
+
+Модуль тянет Dash, dash_leaflet и Plotly, поэтому main.create_app импортирует
+его только при включённом дашборде; API без дашборда стартует без них.
+"""
+import json
+import os
+import secrets
+from datetime import datetime, timezone
+
+import dash_leaflet
+import numpy as np
+import plotly.graph_objs as go
+from dash import Dash, dcc, html, Input, Output, ALL, ctx, no_update
+from flask import render_template, request, redirect, has_request_context
+
+from routes.weather import assess_samples
+from utls.archive import forecast_archive
+from utls.cache import TTLCache
+from utls.http_cache import check_etag
+from utls.main import (
+    get_weather_data, forecast_version, resolve_location, resolve_route, sample_route_forecasts, FORECAST_CACHE_TTL,
+)
+from utls.metrics import timed, DASH_CALLBACK_SECONDS
+from utls.session_store import RouteStore, ROUTE_COOKIE, ROUTE_SESSION_TTL
+
+# Маршрут хранится по токену сессии из cookie, а не в памяти процесса
+route_store = RouteStore()
+
+
+def current_route():
+    # Dash вызывает serve_layout и при старте, вне запроса — тогда маршрута нет
+    if not has_request_context():
+        return []
+    return route_store.load(request.cookies.get(ROUTE_COOKIE))
+
+
+def index():
+    if request.method == 'POST':
+        start_point = request.form['start_point']
+        end_point = request.form['end_point']
+        intermediate_cities = request.form.getlist('intermediate_city')
+
+        cities = [start_point] + intermediate_cities + [end_point]
+        token = request.cookies.get(ROUTE_COOKIE) or secrets.token_urlsafe(16)
+        route_store.save(token, cities)
+
+        response = redirect('/dash/')
+        response.set_cookie(ROUTE_COOKIE, token, max_age=ROUTE_SESSION_TTL, httponly=True, samesite='Lax')
+        return response
+
+    return render_template('index.html')
+
+
+METRIC_LABELS = {
+    'temperature': 'Температура',
+    'wind_speed': 'Скорость ветра',
+    'precipitation': 'Вероятность осадков'
+}
+
+# История из архива прогнозов (utls.archive): за сколько суток и сколько дней прогноза показывать
+HISTORY_DAYS = int(os.getenv("HISTORY_DAYS", 30))
+HISTORY_TRACES = int(os.getenv("HISTORY_TRACES", 7))
+
+# Готовые фигуры для первой отрисовки; переключение метрик и дней — на стороне клиента
+FIGURE_CACHE_SIZE = 256
+figure_cache = TTLCache(maxsize=FIGURE_CACHE_SIZE, ttl=FORECAST_CACHE_TTL)
+# История по (ключ локации, сутки UTC): новые записи в архиве появляются не чаще обновления прогноза
+history_cache = TTLCache(maxsize=FIGURE_CACHE_SIZE, ttl=FORECAST_CACHE_TTL)
+
+
+def forecast_store_data(city_name):
+    """Компактные данные всех метрик за 5 дней для dcc.Store."""
+    weather_data = get_weather_data(city_name, 5)
+    if weather_data is None:
+        return None
+    return {
+        'city': city_name,
+        'stale': weather_data.attrs.get('stale', False),
+        'dates': weather_data['date'].dt.strftime('%Y-%m-%d').tolist(),
+        **{metric: weather_data[metric].tolist() for metric in METRIC_LABELS},
+    }
+
+
+def build_figure(city_name, days, metric):
+    key = (city_name, days, metric)
+    fig = figure_cache.get(key)
+    if fig is not None:
+        return fig
+
+    fig = go.Figure()
+    weather_data = get_weather_data(city_name, days) if city_name else None
+    if weather_data is None:
+        fig.update_layout(title="Выберите город для отображения графика", template='plotly_white')
+        return fig
+
+    stale = weather_data.attrs.get('stale', False)
+    fig.add_trace(go.Scatter(x=weather_data['date'], y=weather_data[metric], mode='lines', name=metric))
+    fig.update_layout(
+        title=f'{METRIC_LABELS[metric]} в {city_name} за {days} дней' + (' (устаревшие данные)' if stale else ''),
+        xaxis_title='Дата',
+        yaxis_title='Значение',
+        template='plotly_white'
+    )
+    if not stale:
+        figure_cache.set(key, fig)
+    return fig
+
+
+@timed(DASH_CALLBACK_SECONDS, callback="layout")
+def serve_layout():
+    cities = current_route()
+    city_name = cities[0] if len(cities) > 0 else None
+    return html.Div([
+        html.H1("Карта маршрута"),
+        dcc.Store(id='forecast-store', data=forecast_store_data(city_name) if city_name else None),
+
+        html.Div([
+            dash_leaflet.Map(center=[50, 50], zoom=4, children=[
+                dash_leaflet.TileLayer(),
+                dash_leaflet.LayerGroup(id="markers-layer"),
+                dash_leaflet.LayerGroup(id="samples-layer"),
+                dash_leaflet.Polyline(id="route-line", positions=[])
+            ], id="map", style={'width': '50vw', 'height': '50vh'}),
+
+            html.Div([
+                dcc.Graph(id='weather-graph', figure=build_figure(city_name, 3, 'temperature'))
+            ], id='weather-graph-container', style={'width': '50vw', 'height': '50vh'})
+        ], style={'display': 'flex', 'width': '100%', 'justify-content': 'space-between'}),
+
+        html.Div([
+            dcc.Dropdown(
+                id='metric-dropdown',
+                options=[{'label': label, 'value': metric} for metric, label in METRIC_LABELS.items()],
+                value='temperature',
+                clearable=False,
+                style={'width': '50%'}
+            ),
+
+            dcc.Dropdown(
+                id='days-dropdown',
+                options=[
+                    {'label': '3 дня', 'value': 3},
+                    {'label': '5 дней', 'value': 5}
+                ],
+                value=3,
+                clearable=False,
+                style={'width': '50%'}
+            )
+        ], style={'width': '100%', 'marginTop': '10px', 'display': 'flex', 'justify-content': 'center'}),
+
+        dcc.Store(id='history-store'),
+        dcc.Graph(id='history-graph')
+    ])
+
+
+def layout_not_modified():
+    """
+    304 на повторную загрузку раскладки, если маршрут и прогноз первого города не менялись.
+
+    Раскладка — единственный GET дашборда с данными; колбэки Dash идут POST-запросами,
+    а их браузер условно не повторяет.
+    """
+    cities = current_route()
+    version = forecast_version(cities[0]) if cities else None
+    return check_etag(cities, version)
+
+
+@timed(DASH_CALLBACK_SECONDS, callback="add_route_and_markers")
+def add_route_and_markers(_):
+    city_markers = []
+    route_positions = []
+    sample_markers = []
+
+    cities = current_route()
+    locations = resolve_route(cities, prefetch_forecasts=True)
+    for city, location in zip(cities, locations):
+        if location:
+            coordinates = (location['latitude'], location['longitude'])
+            route_positions.append(coordinates)
+            marker = dash_leaflet.Marker(position=coordinates, children=[
+                dash_leaflet.Tooltip(city),
+                dash_leaflet.Popup([html.H3(city), html.P("")])
+            ], id={'type': 'marker', 'index': city})
+            city_markers.append(marker)
+
+    # Погода между путевыми точками: по одной точке на ячейку вдоль дуг большого круга
+    path, samples = sample_route_forecasts(locations)
+    if len(path) > 1:
+        route_positions = path
+    for sample, assessment in zip(samples, assess_samples(samples)):
+        color = 'red' if assessment.startswith("Неблагоприятные") else 'green'
+        sample_markers.append(dash_leaflet.CircleMarker(
+            center=[sample['latitude'], sample['longitude']], radius=6, color=color,
+            children=[dash_leaflet.Tooltip(f"{sample['location']['name']}: {assessment}")]
+        ))
+    return city_markers, route_positions, sample_markers
+
+
+@timed(DASH_CALLBACK_SECONDS, callback="load_city_forecast")
+def load_city_forecast(n_clicks):
+    # Срабатывает и при появлении маркеров; реагируем только на настоящий клик
+    if not isinstance(ctx.triggered_id, dict) or not any(n_clicks):
+        return no_update
+    return forecast_store_data(ctx.triggered_id['index'])
+
+
+def history_traces(location_key):
+    """Линии истории всех метрик: одна на день прогноза, по оси X — время получения."""
+    key = (location_key, datetime.now(timezone.utc).date())
+    traces = history_cache.get(key)
+    if traces is not None:
+        return traces
+
+    history = forecast_archive.history(location_key, HISTORY_DAYS, columns=tuple(METRIC_LABELS))
+    fetched_at = np.datetime_as_string((history['fetched_at'] * 1000).astype('datetime64[ms]'))
+    traces = []
+    for day in sorted(set(history['date'].tolist()))[-HISTORY_TRACES:]:
+        mask = history['date'] == day
+        traces.append({
+            'name': f'{day:%d.%m}',
+            'x': fetched_at[mask].tolist(),
+            **{metric: history[metric][mask].astype(float).round(2).tolist() for metric in METRIC_LABELS},
+        })
+    history_cache.set(key, traces)
+    return traces
+
+
+@timed(DASH_CALLBACK_SECONDS, callback="history")
+def history_store_data(data):
+    """История прогнозов выбранного города для dcc.Store; метрику выбирает клиент."""
+    city = data['city'] if data else None
+    location = resolve_location(city)[0] if city else None
+    if location is None:
+        return None
+    return {'city': city, 'traces': history_traces(location['key'])}
+
+
+# Переключение метрик и дней без запроса к серверу
+GRAPH_CLIENTSIDE_CALLBACK = """
+    function(data, metric, days) {
+        const labels = %s;
+        const layout = {
+            xaxis: {title: {text: 'Дата'}, gridcolor: '#EBF0F8'},
+            yaxis: {title: {text: 'Значение'}, gridcolor: '#EBF0F8'},
+            plot_bgcolor: 'white',
+            paper_bgcolor: 'white'
+        };
+        if (!data) {
+            layout.title = {text: 'Выберите город для отображения графика'};
+            return {data: [], layout: layout};
+        }
+        const n = Math.min(days, data.dates.length);
+        layout.title = {text: labels[metric] + ' в ' + data.city + ' за ' + days + ' дней'
+                              + (data.stale ? ' (устаревшие данные)' : '')};
+        return {
+            data: [{type: 'scatter', mode: 'lines', name: metric,
+                    x: data.dates.slice(0, n), y: data[metric].slice(0, n)}],
+            layout: layout
+        };
+    }
+    """ % json.dumps(METRIC_LABELS, ensure_ascii=False)
+
+# История приходит в history-store сразу по всем метрикам; метрика переключается так же на клиенте
+HISTORY_CLIENTSIDE_CALLBACK = """
+    function(data, metric) {
+        const labels = %s;
+        const layout = {
+            xaxis: {title: {text: 'Когда получен прогноз'}, gridcolor: '#EBF0F8'},
+            yaxis: {title: {text: 'Значение'}, gridcolor: '#EBF0F8'},
+            plot_bgcolor: 'white',
+            paper_bgcolor: 'white'
+        };
+        if (!data) {
+            layout.title = {text: 'Выберите город для истории прогнозов'};
+            return {data: [], layout: layout};
+        }
+        if (!data.traces.length) {
+            layout.title = {text: 'История прогнозов для ' + data.city + ' пока пуста'};
+            return {data: [], layout: layout};
+        }
+        layout.title = {text: 'Как менялся прогноз: ' + labels[metric] + ' в ' + data.city};
+        return {
+            data: data.traces.map((trace) => ({type: 'scatter', mode: 'lines+markers', name: trace.name,
+                                               x: trace.x, y: trace[metric]})),
+            layout: layout
+        };
+    }
+    """ % json.dumps(METRIC_LABELS, ensure_ascii=False)
+
+
+def init_dashboard(server):
+    """
+    Подключает дашборд к приложению Flask: форма маршрута на / и Dash на /dash/.
+
+    Returns:
+        dash.Dash: Приложение Dash.
+    """
+    server.add_url_rule('/', 'index', index, methods=['GET', 'POST'])
+
+    dash_app = Dash(__name__, server=server, url_base_pathname='/dash/')
+    dash_app.layout = serve_layout
+
+    layout_path = dash_app.config.routes_pathname_prefix + '_dash-layout'
+
+    @server.before_request
+    def _check_layout_etag():
+        if request.method == 'GET' and request.path == layout_path:
+            return layout_not_modified()
+        return None
+
+    dash_app.callback(
+        [Output("markers-layer", "children"), Output("route-line", "positions"), Output("samples-layer", "children")],
+        Input('map', 'id')
+    )(add_route_and_markers)
+    dash_app.callback(
+        Output("forecast-store", "data"),
+        Input({'type': 'marker', 'index': ALL}, 'n_clicks'),
+        prevent_initial_call=True
+    )(load_city_forecast)
+    dash_app.callback(
+        Output("history-store", "data"),
+        Input("forecast-store", "data")
+    )(history_store_data)
+    dash_app.clientside_callback(
+        HISTORY_CLIENTSIDE_CALLBACK,
+        Output("history-graph", "figure"),
+        [Input("history-store", "data"), Input("metric-dropdown", "value")]
+    )
+    dash_app.clientside_callback(
+        GRAPH_CLIENTSIDE_CALLBACK,
+        Output("weather-graph", "figure"),
+        [Input("forecast-store", "data"), Input("metric-dropdown", "value"), Input("days-dropdown", "value")],
+        prevent_initial_call=True
+    )
+    return dash_app
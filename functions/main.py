@@ -1,61 +1,69 @@
+import logging
 import requests
-import pandas as pd
 from api_key import API_KEY
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utls.main import resolve_location, accuweather_get, CURRENT_CONDITIONS_URL
+from utls.quota import QuotaExceeded, QUOTA_EXCEEDED_STATUS
+from utls.breaker import CircuitOpen
+from utls.scoring import score_weather
 
 api_key = API_KEY
 
+logger = logging.getLogger(__name__)
+
+# Запросы для двух городов идут параллельно: ответ ждёт самый медленный, а не сумму
+_executor = ThreadPoolExecutor(max_workers=4)
+
 
 # print(f'Ваш API ключ: {api_key}')
 
 
 def IsWeatherGood(temperature, humidity, wind_speed, visibility):
     '''
-    The weather is good while
+    The weather is good while (defaults, see utls.scoring.THRESHOLDS)
     temperature in [0, 35]*C
     humidity in [30, 60]%
     wind_speed <= 50km/h
     visibility >= 10km
     '''
 
-    return 0 <= temperature <= 35 and 30 <= humidity <= 60 \
-        and wind_speed <= 50 and visibility >= 10
+    good, _ = score_weather(temperature, wind_speed, humidity=humidity, visibility=visibility)
+    return bool(good)
 
 
 def GetLocationKeyByName(city: str):
-    # Get location key by city name
+    # Get location key by city name (shared cached resolver)
 
-    url = 'http://dataservice.accuweather.com/locations/v1/cities/search'
-    params = {
-        'apikey': api_key,
-        'q': city
-    }
-    response = requests.get(url, params=params)
+    location, status_code = resolve_location(city, api_key)
 
     location_key = None
-    if response.status_code == 200:
-        try:
-            data = response.json()[0]
-            # print(json.dumps(data, indent=4, ensure_ascii=False))
-            location_key = data['Key']
-        except:
-            location_key = None
-    else:
-        print(f'Error: {response.status_code}')
+    if location:
+        location_key = location['key']
+    elif status_code != 200:
+        logger.warning('GetLocationKeyByName: status %s', status_code)
 
-    return (location_key, response.status_code)
+    return (location_key, status_code)
 
 
 def GetWeatherData(location_key):
     # Get weather information by location key
 
-    url = f'http://dataservice.accuweather.com/currentconditions/v1/{location_key}'
+    url = f'{CURRENT_CONDITIONS_URL}{location_key}'
     params = {
         'apikey': api_key,
         'details': 'true'
     }
 
-    response = requests.get(url, params=params)
+    try:
+        response = accuweather_get(url, params)
+    except QuotaExceeded:
+        logger.warning('GetWeatherData: quota exceeded')
+        return (None, QUOTA_EXCEEDED_STATUS)
+    except (CircuitOpen, requests.exceptions.RequestException) as e:
+        logger.warning('GetWeatherData: %r', e)
+        return (None, None)
     data = None
     if response.status_code == 200:
         try:
@@ -64,7 +72,7 @@ def GetWeatherData(location_key):
         except:
             data = None
     else:
-        print(f'Error: {response.status_code}')
+        logger.warning('GetWeatherData: status %s', response.status_code)
 
     return (data, response.status_code)
 
@@ -95,8 +103,7 @@ class Response(Enum):
 
 
 def GetRecommendation(city1: str, city2: str):
-    res1 = GetLocationKeyByName(city1)
-    res2 = GetLocationKeyByName(city2)
+    res1, res2 = _executor.map(GetLocationKeyByName, (city1, city2))
     location_key1 = res1[0]
     location_key2 = res2[0]
 
@@ -106,8 +113,7 @@ def GetRecommendation(city1: str, city2: str):
         else:
             return Response.USER_ERROR
 
-    res1 = GetWeatherData(location_key1)
-    res2 = GetWeatherData(location_key2)
+    res1, res2 = _executor.map(GetWeatherData, (location_key1, location_key2))
     json1 = res1[0]
     json2 = res2[0]
 
@@ -123,8 +129,7 @@ def GetRecommendation(city1: str, city2: str):
     except:
         return Response.ERROR
 
-    print(data1)
-    print(data2)
+    logger.debug('%s %s', data1, data2)
 
     flag1 = IsWeatherGood(**data1)
     flag2 = IsWeatherGood(**data2)
@@ -141,6 +146,8 @@ import random
 
 def get_weather_data(start_point, end_point):
     # Имитация данных о погоде для семи дней
+    import pandas as pd
+
     dates = [datetime.now() + timedelta(days=i) for i in range(7)]
     data = {
         'date': dates,
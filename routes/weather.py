@@ -1,7 +1,15 @@
+import json
 import os
-from utls.main import *
-from flask import Blueprint, render_template, request
-import requests
+from utls.main import (
+    get_location_key, fetch_daily_forecast, resolve_location, sample_route_forecasts, iter_city_forecasts,
+    iter_route_samples, _normalize_city, CONNECTION_ERROR_CODES, STALE_STATUS,
+)
+from utls.decoder import decode_forecasts
+from utls.quota import QUOTA_EXCEEDED_CODES
+from utls.gazetteer import gazetteer
+from utls.http_cache import check_etag
+from utls.scoring import score_weather, score_table, describe
+from flask import Blueprint, Response, render_template, request, jsonify, stream_with_context
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,59 +18,132 @@ API_KEY = os.getenv('API_KEY')
 # API_KEY = "IIGkMIUNxvGQWyJqPWYnoGWp0yRQjnhI"
 bp = Blueprint('weather', __name__, url_prefix='/weather')
 
+# Пакетная оценка маршрутов: предел числа маршрутов в одном запросе
+BATCH_MAX_ROUTES = int(os.getenv('BATCH_MAX_ROUTES', 1000))
+# Горизонт прогноза AccuWeather, дней
+FORECAST_DAYS = 5
+
 
 @bp.route('/route', methods=['GET', 'POST'])
 def weather_route():
-    print("weather")
-    if request.method == 'POST':
-        print("post weather")
-        start_city = request.form.get('start')
+    # GET /weather/route?start=...&end=... — тот же результат по ссылке, с ETag:
+    # повторный просмотр без изменений в прогнозах получает 304 без отрисовки
+    if request.method == 'POST' or request.args.get('start') and request.args.get('end'):
+        values = request.form if request.method == 'POST' else request.args
+        # Форма index.html (на / при WEB_DASHBOARD=0 она отправляется сюда) называет поля start_point и end_point
+        start_city = values.get('start') or values.get('start_point')
         # gap_city = request.form.get('gap')
-        end_city = request.form.get('end')
+        end_city = values.get('end') or values.get('end_point')
 
         start_key = get_location_key(start_city, API_KEY)
         end_key = get_location_key(end_city, API_KEY)
+        if start_key == "quota_exceeded" or end_key == "quota_exceeded":
+            return render_template('error.html', error="Исчерпан лимит запросов к API, попробуйте позже")
         if start_key == "connection_error" or end_key == "connection_error":
             return render_template('error.html', error="Не удалось подключиться к API")
 
         if not start_key or not end_key:
             return render_template('error.html', error="Ошибка при получении данных о городах")
 
-        start_weather = get_forecast(start_key, API_KEY)
-        end_weather = get_forecast(end_key, API_KEY)
+        start_forecast, start_status = fetch_daily_forecast(start_key, API_KEY)
+        end_forecast, end_status = fetch_daily_forecast(end_key, API_KEY)
 
-        if start_weather == "connection_error" or end_weather == "connection_error":
-            return render_template('error.html', error="Не удалось подключиться к API")
-        if not start_weather or not end_weather:
-            return render_template('error.html', error="Ошибка при получении данных о погоде")
+        if start_forecast is None or end_forecast is None:
+            error = api_error((start_status, end_status)) or "Ошибка при получении данных о погоде"
+            return render_template('error.html', error=error)
 
-        start_temp = start_weather[0]['Temperature']['Metric']['Value']
-        end_temp = end_weather[0]['Temperature']['Metric']['Value']
+        route_locations = [resolve_location(city, API_KEY)[0] for city in (start_city, end_city)]
+        _, samples = sample_route_forecasts(route_locations, API_KEY)
+        stale = STALE_STATUS in (start_status, end_status)
 
-        start_wind_speed = get_wind_speed(start_weather[0])
-        end_wind_speed = get_wind_speed(end_weather[0])
+        if request.method == 'GET':
+            not_modified = check_etag(
+                start_city, end_city, stale, start_forecast.digest(), end_forecast.digest(),
+                [[sample['location']['name'], sample['forecast'].digest()] for sample in samples],
+            )
+            if not_modified is not None:
+                return not_modified
 
-        start_precipitation_probability = get_precipitation_probability(start_weather[0])
-        end_precipitation_probability = get_precipitation_probability(end_weather[0])
-        start_precipitation = get_precipitation(start_weather[0])
-        end_precipitation = get_precipitation(end_weather[0])
+        # Все точки маршрута по порядку: одна таблица и одна оценка дни × точки
+        payloads = {'start': start_forecast}
+        payloads.update((i, sample['forecast']) for i, sample in enumerate(samples))
+        payloads['end'] = end_forecast
+        table = decode_forecasts(payloads)
+        scores = score_table(table)
+        today_assessments = describe(scores['reason'][0])
 
-        start_assessment = check_bad_weather(start_temp, start_wind_speed, start_precipitation_probability,
-                                             start_precipitation)
-        end_assessment = check_bad_weather(end_temp, end_wind_speed, end_precipitation_probability, end_precipitation)
+        today = table[table['day'] == 0].set_index('location')
+        start_weather = today.loc['start'].to_dict()
+        end_weather = today.loc['end'].to_dict()
+        start_assessment = today_assessments[0]
+        end_assessment = today_assessments[-1]
+        route_assessments = [
+            {'name': sample['location']['name'], 'assessment': assessment}
+            for sample, assessment in zip(samples, today_assessments[1:-1])
+        ]
+        best_day = scores['best_day']
 
         return render_template(
             'result.html',
+            stale=stale,
             start=start_city,
             end=end_city,
-            start_weather=start_weather[0],
-            end_weather=end_weather[0],
+            start_weather=start_weather,
+            end_weather=end_weather,
             start_assessment=start_assessment,
-            end_assessment=end_assessment
+            end_assessment=end_assessment,
+            route_assessments=route_assessments,
+            best_day=scores['dates'][best_day].strftime('%d.%m.%Y') if best_day is not None else None
         )
     return render_template('index.html')
 
 
+@bp.route('/routes', methods=['POST'])
+def weather_routes():
+    """
+    Пакетная оценка маршрутов для интеграций.
+
+    Тело — JSON {"routes": [{"start": ..., "end": ..., "via": [...], "days": 1..5}, ...]}.
+    Ответ — NDJSON: по строке на маршрут в порядке готовности, index — номер маршрута
+    в запросе. Каждый город запрашивается один раз на весь пакет.
+    """
+    routes, error = parse_batch(request.get_json(silent=True))
+    if error:
+        return jsonify(error=error), 400
+    return Response(stream_with_context(assess_batch(routes)), mimetype='application/x-ndjson')
+
+
+@bp.route('/route/stream')
+def weather_route_stream():
+    """
+    Результат маршрута по мере готовности точек: Server-Sent Events.
+
+    События: point — начальная или конечная точка, sample — точка по пути,
+    summary — лучший день по всем точкам, error — маршрут оценить не удалось.
+    Обычный запрос из браузера (не EventSource) получает страницу, которая
+    подписывается на поток и дорисовывает точки по одной.
+    """
+    start_city = request.args.get('start', '').strip()
+    end_city = request.args.get('end', '').strip()
+    if not start_city or not end_city:
+        return jsonify(error="Нужны параметры start и end"), 400
+    if request.accept_mimetypes.best != 'text/event-stream':
+        return render_template('route_stream.html', start=start_city, end=end_city)
+
+    response = Response(stream_with_context(stream_route(start_city, end_city)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Прокси (nginx) не должен копить поток до конца ответа
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.route('/autocomplete')
+def autocomplete():
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify([entry['name'] for entry in gazetteer.complete(query, limit)])
+
+
 # def get_location_key(city):
 #     url = f"http://dataservice.accuweather.com/locations/v1/cities/search?apikey={API_KEY}&q={city}"
 #     response = requests.get(url)
@@ -89,31 +170,177 @@ def weather_route():
 
 
 def check_bad_weather(temperature, wind_speed, precipitation_prob, has_precipitation):
-    if temperature < 0 or temperature > 35:
-        return "Неблагоприятные условия - температура"
-    if wind_speed > 50:
-        return "Неблагоприятные условия - ветер"
-    if precipitation_prob > 70 or has_precipitation:
-        return "Неблагоприятные условия - осадки"
-    return "Благоприятные условия"
-
-
-def get_wind_speed(weather_data):
-    try:
-        return weather_data['Wind']['Speed']['Metric']['Value']
-    except KeyError:
-        return 0
-
-
-def get_precipitation_probability(weather_data):
-    try:
-        return weather_data['PrecipitationProbability']
-    except KeyError:
-        return 0
-
-
-def get_precipitation(weather_data):
-    try:
-        return weather_data['HasPrecipitation']
-    except KeyError:
-        return 0
\ No newline at end of file
+    _, reason = score_weather(temperature, wind_speed, precipitation_prob, has_precipitation)
+    return describe(reason)
+
+
+def api_error(statuses):
+    """Сообщение об ошибке API по статусам ответов или None, если дело не в API."""
+    if any(status in QUOTA_EXCEEDED_CODES for status in statuses):
+        return "Исчерпан лимит запросов к API, попробуйте позже"
+    if any(status is None or status in CONNECTION_ERROR_CODES for status in statuses):
+        return "Не удалось подключиться к API"
+    return None
+
+
+def parse_batch(data):
+    """
+    Проверяет тело пакетного запроса.
+
+    Returns:
+        tuple: (routes, error); routes — список словарей с cities (все точки по порядку)
+        и days, error — текст ошибки или None.
+    """
+    routes = data.get('routes') if isinstance(data, dict) else None
+    if not isinstance(routes, list) or not routes:
+        return None, "Ожидается JSON с непустым списком routes"
+    if len(routes) > BATCH_MAX_ROUTES:
+        return None, f"Не больше {BATCH_MAX_ROUTES} маршрутов в одном запросе"
+
+    parsed = []
+    for index, route in enumerate(routes):
+        if not isinstance(route, dict):
+            return None, f"Маршрут {index}: ожидается объект"
+        via = route.get('via') or []
+        cities = [route.get('start')] + (via if isinstance(via, list) else [via]) + [route.get('end')]
+        if not all(isinstance(city, str) and city.strip() for city in cities):
+            return None, f"Маршрут {index}: start, end и via должны быть непустыми строками"
+        days = route.get('days', FORECAST_DAYS)
+        if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= FORECAST_DAYS:
+            return None, f"Маршрут {index}: days — целое число от 1 до {FORECAST_DAYS}"
+        parsed.append({'cities': cities, 'days': days})
+    return parsed, None
+
+
+def assess_batch(routes):
+    """
+    Оценивает маршруты из parse_batch, выдавая строки NDJSON по мере готовности.
+
+    Прогноз города хранится, пока он нужен хотя бы одному неоценённому маршруту.
+    """
+    route_keys = [list(dict.fromkeys(_normalize_city(city) for city in route['cities'])) for route in routes]
+    waiting = {}
+    for index, keys in enumerate(route_keys):
+        for city_key in keys:
+            waiting.setdefault(city_key, []).append(index)
+    uses = {city_key: len(indexes) for city_key, indexes in waiting.items()}
+    remaining = [len(keys) for keys in route_keys]
+    results = {}
+
+    cities = [city for route in routes for city in route['cities']]
+    for city_key, location, payload, status_code in iter_city_forecasts(cities, API_KEY):
+        results[city_key] = (location, payload, status_code)
+        for index in waiting.pop(city_key):
+            remaining[index] -= 1
+            if remaining[index]:
+                continue
+            yield json.dumps(assess_route(index, routes[index], results), ensure_ascii=False) + "\n"
+            for key in route_keys[index]:
+                uses[key] -= 1
+                if not uses[key]:
+                    del results[key]
+
+
+def assess_route(index, route, results):
+    """Результат одного маршрута пакета; results — город -> (location, payload, status_code)."""
+    cities = route['cities']
+    points = [results[_normalize_city(city)] for city in cities]
+    result = {'index': index, 'start': cities[0], 'end': cities[-1], 'via': cities[1:-1]}
+
+    for city, (location, payload, status_code) in zip(cities, points):
+        if location is None:
+            result['error'] = api_error((status_code,)) or f"Город не найден: {city}"
+            return result
+        if payload is None:
+            result['error'] = api_error((status_code,)) or "Ошибка при получении данных о погоде"
+            return result
+
+    scores = score_table(decode_forecasts({i: payload for i, (_, payload, _) in enumerate(points)}), route['days'])
+    today = describe(scores['reason'][0])
+    best_day = scores['best_day']
+    result.update(
+        stale=any(status_code == STALE_STATUS for _, _, status_code in points),
+        dates=[day.strftime('%Y-%m-%d') for day in scores['dates']],
+        best_day=scores['dates'][best_day].strftime('%Y-%m-%d') if best_day is not None else None,
+        points=[
+            {'city': city, 'name': location['name'], 'assessment': assessment, 'good': good}
+            for city, (location, _, _), assessment, good
+            in zip(cities, points, today, scores['good'].T.tolist())
+        ],
+    )
+    return result
+
+
+def assess_samples(samples):
+    """Оценка погоды на сегодня в промежуточных точках маршрута, в порядке samples."""
+    if not samples:
+        return []
+    scores = score_table(decode_forecasts({i: sample['forecast'] for i, sample in enumerate(samples)}), days=1)
+    return list(describe(scores['reason'][0]))
+
+
+def sse_event(event, data):
+    """Одно событие Server-Sent Events с данными в JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def today_weather(forecast):
+    """Погода на сегодня из utls.records.Forecast и её оценка."""
+    day = forecast.days[0]
+    weather = {
+        'date': day.date.isoformat(),
+        'temperature_min': day.temperature_min,
+        'temperature': day.temperature,
+        'wind_speed': day.wind_speed,
+        'precipitation': day.precipitation,
+        'has_precipitation': day.has_precipitation,
+        'link': day.link,
+    }
+    return weather, check_bad_weather(day.temperature, day.wind_speed, day.precipitation, day.has_precipitation)
+
+
+def stream_route(start_city, end_city):
+    """
+    События SSE для weather_route_stream.
+
+    Начальная и конечная точки отправляются, как только готов их прогноз, затем
+    точки по пути в порядке готовности и в конце summary по всем точкам.
+    """
+    roles = {}
+    for role, city in (('start', start_city), ('end', end_city)):
+        roles.setdefault(_normalize_city(city), []).append((role, city))
+
+    points = {}
+    for city_key, location, payload, status_code in iter_city_forecasts([start_city, end_city], API_KEY):
+        if location is None or payload is None:
+            city = roles[city_key][0][1]
+            error = api_error((status_code,)) or (
+                f"Город не найден: {city}" if location is None else "Ошибка при получении данных о погоде")
+            yield sse_event('error', {'error': error})
+            return
+        weather, assessment = today_weather(payload)
+        for role, city in roles[city_key]:
+            points[role] = (location, payload, status_code)
+            yield sse_event('point', {
+                'role': role, 'city': city, 'name': location['name'], 'weather': weather,
+                'assessment': assessment, 'stale': status_code == STALE_STATUS,
+            })
+
+    samples = {}
+    for index, sample in iter_route_samples([points['start'][0], points['end'][0]], API_KEY):
+        samples[index] = sample
+        _, assessment = today_weather(sample['forecast'])
+        yield sse_event('sample', {
+            'index': index, 'name': sample['location']['name'],
+            'latitude': sample['latitude'], 'longitude': sample['longitude'], 'assessment': assessment,
+        })
+
+    payloads = {'start': points['start'][1]}
+    payloads.update((index, samples[index]['forecast']) for index in sorted(samples))
+    payloads['end'] = points['end'][1]
+    scores = score_table(decode_forecasts(payloads))
+    best_day = scores['best_day']
+    yield sse_event('summary', {
+        'stale': any(status_code == STALE_STATUS for _, _, status_code in points.values()),
+        'best_day': scores['dates'][best_day].strftime('%d.%m.%Y') if best_day is not None else None,
+    })
@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+# Модули приложения читают настройки при импорте: состояние — во временном каталоге
+_state_dir = tempfile.mkdtemp(prefix="weather-test-")
+os.environ["GAZETTEER_KEYS_FILE"] = os.path.join(_state_dir, "gazetteer_keys.json")
+os.environ["QUOTA_STATE_FILE"] = os.path.join(_state_dir, "quota_state.json")
+os.environ["ARCHIVE_ENABLED"] = "0"
+os.environ["CACHE_BACKEND"] = "memory"
+
+import pytest  # noqa: E402
+
+from utls import main  # noqa: E402
+from utls.gazetteer import Gazetteer, GAZETTEER_FILE, learn  # noqa: E402
+
+OMSK = {"key": "285800", "name": "Омск", "latitude": 54.9885, "longitude": 73.3242}
+
+
+@pytest.fixture
+def gazetteer():
+    result = Gazetteer()
+    result.load_csv(GAZETTEER_FILE)
+    return result
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    # Вместо запроса к AccuWeather: город не найден, запросы запоминаются
+    queries = []
+
+    def search_city(city, cache_key, api_key):
+        queries.append(city)
+        return None, 200
+
+    monkeypatch.setattr(main, "_search_city", search_city)
+    main.location_cache.clear()
+    return queries
+
+
+def test_lookup_does_not_accept_typos(gazetteer):
+    assert gazetteer.lookup("Омск")["name"] == "Омск"
+    assert gazetteer.lookup("Орск") is None
+    assert gazetteer.lookup("Pinsk") is None
+
+
+def test_autocomplete_still_suggests_similar_names(gazetteer):
+    assert "Омск" in [entry["name"] for entry in gazetteer.complete("Орск")]
+
+
+def test_resolve_location_does_not_substitute_similar_city(searches):
+    learn(OMSK)
+
+    assert main.resolve_location("Омск")[0]["key"] == OMSK["key"]
+    location, _ = main.resolve_location("Орск")
+    assert location is None
+    assert searches == ["Орск"]
+
+
+def test_city_coordinates_do_not_substitute_similar_city(searches):
+    assert main.get_city_coordinates("Pinsk") is None
+    assert searches == ["Pinsk"]
@@ -1,83 +1,115 @@
-from datetime import datetime
 import logging
-import requests
 import asyncio
-from aiogram import Bot, Dispatcher, types, F
+import time
+from aiogram import Bot, Dispatcher, BaseMiddleware, types, F
 from aiogram.filters.command import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.dispatcher.router import Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from dotenv import load_dotenv
 import os
 
+from utls.main import CONNECTION_ERROR_CODES, STALE_STATUS, forecast_refresher
+from utls.quota import QUOTA_EXCEEDED_CODES
+from utls.async_client import AsyncWeatherClient
+from utls.decoder import decode_forecasts
+from utls.scoring import score_table
+from utls.metrics import start_metrics_server, BOT_HANDLER_SECONDS, BOT_HANDLERS_IN_FLIGHT
+
 load_dotenv()
 
 API_KEY = os.getenv("API_KEY")
 API_TOKEN = os.getenv("API_TOKEN")
 
-ACCUWEATHER_LOCATION_URL = "http://dataservice.accuweather.com/locations/v1/cities/geoposition/search"
-ACCUWEATHER_FORECAST_URL = "http://dataservice.accuweather.com/forecasts/v1/daily/"
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время каждого обработчика бота в метрике weather_bot_handler_seconds."""
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        BOT_HANDLERS_IN_FLIGHT.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            BOT_HANDLERS_IN_FLIGHT.dec()
+            BOT_HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
 
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
+weather_client = AsyncWeatherClient(API_KEY)
+dp.shutdown.register(weather_client.close)
 router = Router()
 dp.include_router(router)
+# Промежуточные слои диспетчера действуют и на обработчики вложенного router
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
 logging.basicConfig(level=logging.INFO)
 
 
-def get_location_key(city):
-    url = f"http://dataservice.accuweather.com/locations/v1/cities/search?apikey={API_KEY}&q={city}"
-    response = requests.get(url)
-    if response.status_code in (401, 403, 501, 503):
+async def get_location_key(city):
+    location, status_code = await weather_client.resolve_location(city)
+    if status_code in QUOTA_EXCEEDED_CODES:
+        return "quota_exceeded"
+    if status_code is None or status_code in CONNECTION_ERROR_CODES:
         return "connection_error"
-    try:
-        data = response.json()
-        if data:
-            return data[0]['Key']
-    except:
-        return None
-
-
-def get_weather_data(city, days):
-    location_key = get_location_key(city)
-    url = f"http://dataservice.accuweather.com/forecasts/v1/daily/5day/{location_key}?apikey={API_KEY}&metric=true&details=true"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        print(f"Ошибка: get_weather_data не удалось получить данные (код {response.status_code})")
-        return None
-
-    forecast_data = response.json()['DailyForecasts']
-
-    dates = []
-    temperatures = []
-    wind_speeds = []
-    precipitations = []
-
-    for day in forecast_data:
-        date = datetime.strptime(day['Date'][:10], '%Y-%m-%d').strftime('%d.%m.%Y')
-        temperature = day['Temperature']['Maximum']['Value']
-        wind_speed = day['Day']['Wind']['Speed']['Value']
-        precipitation = day['Day'].get('PrecipitationProbability', 0)
-        if len(dates) < days:
-            dates.append(date)
-            temperatures.append(temperature)
-            wind_speeds.append(wind_speed)
-            precipitations.append(precipitation)
+    if location:
+        return location['key']
+    return None
+
+
+FORECAST_ERROR = "Произошла ошибка при получении прогноза погоды."
+QUOTA_ERROR = "Исчерпан лимит запросов к сервису прогнозов, попробуйте позже."
+CONNECTION_ERROR = "Сервис прогнозов сейчас недоступен, попробуйте позже."
+
+
+def status_error(status_code):
+    """Текст ошибки для пользователя по статусу ответа API."""
+    if status_code in QUOTA_EXCEEDED_CODES:
+        return QUOTA_ERROR
+    if status_code is None or status_code in CONNECTION_ERROR_CODES:
+        return CONNECTION_ERROR
+    return FORECAST_ERROR
+
+
+async def get_forecast(city):
+    """
+    Возвращает (payload, stale, error): payload — utls.records.Forecast или None при ошибке,
+    stale — прогноз из просроченного кэша, error — текст ошибки для пользователя или None.
+    """
+    location_key = await get_location_key(city)
+    if location_key == "quota_exceeded":
+        return None, False, QUOTA_ERROR
+    if location_key == "connection_error":
+        return None, False, CONNECTION_ERROR
+    if not location_key:
+        return None, False, f"Город не найден: {city}."
+    payload, status_code = await weather_client.fetch_daily_forecast(location_key)
+
+    if payload is None:
+        logging.warning("get_forecast: не удалось получить данные (код %s)", status_code)
+        return None, False, status_error(status_code)
+
+    return payload, status_code == STALE_STATUS, None
+
+
+def format_forecast(forecast, days):
+    forecast = forecast[forecast['day'] < days]
 
     forecast_message = "Прогноз погоды:\n\n"
-    for date, temp, wind, precip in zip(dates, temperatures, wind_speeds, precipitations):
+    for day in forecast.itertuples(index=False):
         forecast_message += (
-            f"Дата: {date}\n"
-            f"Температура: {temp} °C\n"
-            f"Скорость ветра: {wind} км/ч\n"
-            f"Вероятность осадков: {precip}%\n\n"
+            f"Дата: {day.date:%d.%m.%Y}\n"
+            f"Температура: {day.temperature} °C\n"
+            f"Скорость ветра: {day.wind_speed} км/ч\n"
+            f"Вероятность осадков: {day.precipitation:.0f}%\n\n"
         )
-    headline = response.json()['Headline']
 
-    forecast_message += f"Подробнее: {headline['Link']}"
+    if len(forecast):
+        forecast_message += f"Подробнее: {forecast['link'].iloc[0]}"
     return forecast_message
 
 
@@ -141,6 +173,32 @@ async def process_end_point(message: Message, state: FSMContext):
     await state.set_state(RouteForm.duration)
 
 
+def route_message(start_point, end_point, sections, footer=""):
+    """Текст сообщения о маршруте; у точек, для которых прогноз ещё не готов, — заглушка."""
+    parts = [
+        sections.get(role, f"{city}: получаю прогноз…")
+        for role, city in (('start', start_point), ('end', end_point))
+    ]
+    return (
+        f"Прогноз погоды для маршрута:\n"
+        f"Начальная точка: {start_point}\n"
+        f"Конечная точка: {end_point}\n"
+        f"\n\n" + "\n\n".join(parts) + footer
+    )
+
+
+async def edit_message(message, text):
+    try:
+        await message.edit_text(text)
+    except TelegramBadRequest as e:
+        # Например, текст не изменился; следующее обновление всё равно придёт
+        logging.warning("edit_message: %s", e)
+
+
+async def _role_forecast(role, city):
+    return role, await get_forecast(city)
+
+
 @dp.callback_query(RouteForm.duration)
 async def process_duration(callback_query: CallbackQuery, state: FSMContext):
     duration = int(callback_query.data)
@@ -148,26 +206,55 @@ async def process_duration(callback_query: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     start_point = data['start_point']
     end_point = data['end_point']
-    start_weather = get_weather_data(start_point, duration)
-    end_weather = get_weather_data(end_point, duration)
-
-    if start_weather is None or end_weather is None:
-        await callback_query.message.answer("Произошла ошибка при получении прогноза погоды.")
-        return
-    msg = start_weather + "\n\n" + end_weather
-    await callback_query.message.answer(
-        f"Прогноз погоды для маршрута:\n"
-        f"Начальная точка: {start_point}\n"
-        f"Конечная точка: {end_point}\n"
-        f"\n\n{msg}"
-    )
-    await state.clear()
-
     await callback_query.answer()
 
+    # Сообщение отправляется сразу и дополняется по мере готовности прогнозов точек
+    message = await callback_query.message.answer(route_message(start_point, end_point, {}))
+    forecasts = {}
+    sections = {}
+    stale = False
+    for next_forecast in asyncio.as_completed([
+        _role_forecast('start', start_point),
+        _role_forecast('end', end_point),
+    ]):
+        role, (forecast, point_stale, error) = await next_forecast
+        if forecast is None:
+            await edit_message(message, error)
+            await state.clear()
+            return
+        forecasts[role] = forecast
+        stale = stale or point_stale
+        sections[role] = format_forecast(decode_forecasts({role: forecast}), duration)
+        if len(forecasts) < 2:
+            await edit_message(message, route_message(start_point, end_point, sections))
+
+    table = decode_forecasts({'start': forecasts['start'], 'end': forecasts['end']})
+    footer = ""
+    scores = score_table(table, duration)
+    if scores['best_day'] is not None:
+        footer += f"\n\nЛучший день для выезда: {scores['dates'][scores['best_day']]:%d.%m.%Y}"
+    if stale:
+        footer += "\n\nСервис прогнозов сейчас недоступен, показан последний полученный прогноз."
+    await edit_message(message, route_message(start_point, end_point, sections, footer))
+    await state.clear()
+
 
 async def main():
-    await dp.start_polling(bot)
+    # Популярные прогнозы обновляются в том же цикле событий, что и бот
+    refresher = asyncio.create_task(forecast_refresher.run_async(weather_client.refresh_forecast))
+    # Те же метрики, что у веб-приложения, на отдельном порту (METRICS_PORT);
+    # занятый порт не мешает боту работать
+    try:
+        metrics_runner = await start_metrics_server()
+    except OSError as e:
+        logging.error("Не удалось запустить сервер метрик: %s", e)
+        metrics_runner = None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        refresher.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,228 @@
+"""
+Архив всех полученных прогнозов для истории и трендов без запросов к API.
+
+Хранение колоночное и только на дописывание: каталог на каждые сутки (UTC) по
+времени получения, в нём сегменты — по одному на процесс-писатель, — а в
+сегменте по файлу на столбец с сырыми значениями numpy. Чтение открывает
+через np.memmap только нужные столбцы нужных суток.
+
+    ARCHIVE_DIR/2024-05-01/<pid>-<старт>.<столбец>
+
+У каждого процесса свой сегмент, поэтому воркеры gunicorn и бот пишут в архив
+одновременно без блокировок. Запись идёт из фонового потока через очередь и не
+задерживает запрос; если очередь переполнена, прогноз в архив не попадает.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "forecast_archive")
+ARCHIVE_QUEUE_SIZE = int(os.getenv("ARCHIVE_QUEUE_SIZE", 10000))
+# Сколько прогнозов писатель собирает в одну запись на диск
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 256))
+
+# Столбец -> тип numpy; одна строка — один день прогноза одной локации
+COLUMNS = {
+    "fetched_at": "f8",          # время получения, секунды Unix
+    "location": "S24",           # ключ локации AccuWeather
+    "date": "M8[D]",             # день, на который дан прогноз
+    "lead": "i1",                # за сколько дней до date получен прогноз (номер дня в ответе)
+    "temperature_min": "f4",
+    "temperature": "f4",
+    "wind_speed": "f4",
+    "precipitation": "f4",
+    "has_precipitation": "?",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _partition(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+class ForecastArchive:
+    """
+    Args:
+        path (str): Каталог архива.
+        queue_size (int): Предел очереди на запись.
+        batch_size (int): Сколько прогнозов записывать за раз.
+    """
+
+    def __init__(self, path=ARCHIVE_DIR, queue_size=ARCHIVE_QUEUE_SIZE, batch_size=ARCHIVE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._segment = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def record(self, location_key, forecast, fetched_at=None):
+        """Ставит прогноз (utls.records.Forecast) в очередь на запись; не блокирует."""
+        self._start()
+        try:
+            self._queue.put_nowait((str(location_key), forecast, fetched_at or time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Ждёт, пока всё, что уже в очереди, будет записано."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def _start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Первая запись в этом процессе, в том числе после fork (поток писателя
+            # остался в родителе): свой поток, своя очередь и свой сегмент
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._segment = self._new_segment()
+            threading.Thread(target=self._run, args=(self._queue,), name="forecast-archive", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _new_segment(self):
+        name = f"{os.getpid()}-{int(time.time() * 1000)}"
+        # Новый сегмент после сбоя может начаться в ту же миллисекунду, что и прежний
+        return name if name != self._segment else f"{name}-1"
+
+    def _run(self, items):
+        while True:
+            batch = [items.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(items.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Не удалось записать прогнозы в архив")
+                # Часть столбцов могла успеть дописаться, и строки сегмента больше не
+                # совпадают по номерам; дальше пишем в новый сегмент
+                self._segment = self._new_segment()
+            finally:
+                for _ in batch:
+                    items.task_done()
+
+    def _write(self, batch):
+        by_partition = {}
+        for item in batch:
+            by_partition.setdefault(_partition(item[2]), []).append(item)
+
+        for partition, items in by_partition.items():
+            rows = [
+                (fetched_at, location_key, day.date, lead, day.temperature_min, day.temperature,
+                 day.wind_speed, day.precipitation, day.has_precipitation)
+                for location_key, forecast, fetched_at in items
+                for lead, day in enumerate(forecast)
+            ]
+            table = np.array(rows, dtype=list(COLUMNS.items()))
+            directory = os.path.join(self.path, partition)
+            os.makedirs(directory, exist_ok=True)
+            for column in COLUMNS:
+                with open(os.path.join(directory, f"{self._segment}.{column}"), "ab") as f:
+                    f.write(np.ascontiguousarray(table[column]).tobytes())
+
+    def _segments(self, since, until):
+        try:
+            partitions = sorted(os.listdir(self.path))
+        except FileNotFoundError:
+            return
+        first = _partition(since) if since is not None else None
+        last = _partition(until) if until is not None else None
+        for partition in partitions:
+            if (first and partition < first) or (last and partition > last):
+                continue
+            directory = os.path.join(self.path, partition)
+            for name in sorted(os.listdir(directory)):
+                segment, column = os.path.splitext(name)
+                if column == ".fetched_at":
+                    yield os.path.join(directory, segment)
+
+    @staticmethod
+    def _column(segment, column, rows=None):
+        dtype = np.dtype(COLUMNS[column])
+        path = f"{segment}.{column}"
+        available = os.path.getsize(path) // dtype.itemsize
+        rows = available if rows is None else min(rows, available)
+        if not rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+    def query(self, location_key, since=None, until=None, columns=("temperature",)):
+        """
+        Прогнозы одной локации, полученные в промежутке [since, until].
+
+        Args:
+            location_key (str): Ключ локации AccuWeather.
+            since, until (float): Границы времени получения, секунды Unix; None — без границы.
+            columns (tuple): Какие столбцы прочитать помимо fetched_at, date и lead.
+
+        Returns:
+            dict: Столбец -> numpy.ndarray, строки упорядочены по fetched_at.
+        """
+        names = list(dict.fromkeys(("fetched_at", "date", "lead", *columns)))
+        key = np.bytes_(str(location_key))
+        parts = {name: [] for name in names}
+        for segment in self._segments(since, until):
+            # Строка считается записанной, когда записаны все её столбцы: учитываем
+            # самый короткий файл на случай прерванной записи
+            try:
+                rows = min(os.path.getsize(f"{segment}.{name}") // np.dtype(dtype).itemsize
+                           for name, dtype in COLUMNS.items())
+            except FileNotFoundError:
+                continue
+            fetched_at = self._column(segment, "fetched_at", rows)
+            mask = self._column(segment, "location", rows) == key
+            if since is not None:
+                mask &= fetched_at >= since
+            if until is not None:
+                mask &= fetched_at <= until
+            if not mask.any():
+                continue
+            for name in names:
+                parts[name].append(np.array(self._column(segment, name, rows)[mask]))
+
+        result = {name: np.concatenate(values) if values else np.empty(0, dtype=COLUMNS[name])
+                  for name, values in parts.items()}
+        order = np.argsort(result["fetched_at"], kind="stable")
+        return {name: values[order] for name, values in result.items()}
+
+    def history(self, location_key, days, columns=("temperature",)):
+        """Прогнозы локации за последние days суток."""
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).timestamp()
+        return self.query(location_key, since=since, columns=columns)
+
+
+class _DisabledArchive:
+    # ARCHIVE_ENABLED=0: интерфейс тот же, ничего не пишется и не читается
+    def record(self, location_key, forecast, fetched_at=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def query(self, location_key, since=None, until=None, columns=("temperature",)):
+        names = dict.fromkeys(("fetched_at", "date", "lead", *columns))
+        return {name: np.empty(0, dtype=COLUMNS[name]) for name in names}
+
+    def history(self, location_key, days, columns=("temperature",)):
+        return self.query(location_key, columns=columns)
+
+
+forecast_archive = ForecastArchive() if ARCHIVE_ENABLED else _DisabledArchive()
+atexit.register(forecast_archive.flush)
@@ -0,0 +1,251 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+
+import aiohttp
+
+from utls.main import (
+    API_KEY, CITY_SEARCH_URL, FORECAST_5DAY_URL, STALE_STATUS, STALE_REFRESH_WAIT, REQUEST_TIMEOUT, CONNECT_TIMEOUT,
+    location_cache, forecast_cache, forecast_refresher, spatial_index, _normalize_city, _parse_location, _cache_ttl,
+    upstream_endpoint, conditional_headers, api_unavailable, NOT_MODIFIED_STATUS,
+)
+from utls.archive import forecast_archive
+from utls.cache import CACHE_BACKEND
+from utls.records import Forecast
+from utls.singleflight import AsyncSingleFlight
+from utls.breaker import breaker
+from utls.hedge import hedge_policy
+from utls.metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_IN_FLIGHT, CACHE_LOOKUPS, QUOTA_DENIED
+from utls.gazetteer import gazetteer, learn as learn_location
+from utls.quota import (
+    scheduler as quota_scheduler, is_quota_response, INTERACTIVE, BACKGROUND, QUOTA_EXCEEDED_STATUS,
+)
+
+CONNECTION_LIMIT = int(os.getenv("CONNECTION_LIMIT", 100))
+
+logger = logging.getLogger(__name__)
+
+
+async def _in_thread(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+
+async def _cache_call(fn, *args):
+    # Кэш и счётчик квоты в SQLite (CACHE_BACKEND=sqlite) ходят на диск — из цикла событий
+    # только через пул потоков
+    if CACHE_BACKEND == "sqlite":
+        return await _in_thread(fn, *args)
+    return fn(*args)
+
+
+class AsyncWeatherClient:
+    """
+    Асинхронный клиент AccuWeather для бота.
+
+    Держит одну aiohttp-сессию с пулом keep-alive соединений и использует те же
+    кэши локаций и прогнозов, что и синхронный код из utls.main.
+
+    Args:
+        api_key (str): Ключ AccuWeather.
+        timeout (float): Общий таймаут одного запроса в секундах.
+        limit (int): Максимальное число одновременных соединений в пуле.
+    """
+
+    def __init__(self, api_key=API_KEY, timeout=REQUEST_TIMEOUT, limit=CONNECTION_LIMIT):
+        self.api_key = api_key
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)
+        self.limit = limit
+        self._session = None
+        self._flights = AsyncSingleFlight()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _get_json(self, url, params, priority=INTERACTIVE, headers=None):
+        # Возвращает (data, status_code, headers); status_code None — сеть недоступна.
+        # Повторы и дублирование — как в utls.main.accuweather_get
+        attempt = 0
+        while True:
+            result = await self._get_hedged(url, params, priority, headers)
+            if (attempt >= hedge_policy.retry_attempts or breaker.is_open()
+                    or not hedge_policy.should_retry(result[1])):
+                return result
+            await asyncio.sleep(hedge_policy.backoff(attempt))
+            attempt += 1
+
+    async def _get_hedged(self, url, params, priority, headers):
+        delay = hedge_policy.hedge_delay() if priority == INTERACTIVE else None
+        if delay is None:
+            return await self._get_once(url, params, priority, headers)
+
+        primary = asyncio.ensure_future(self._get_once(url, params, priority, headers))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self._get_once(url, params, BACKGROUND, headers))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                status_code = task.result()[1]
+                # Дубль без квоты или с сетевой ошибкой — не ответ, ждём второй запрос
+                if status_code is not None and status_code != QUOTA_EXCEEDED_STATUS:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+        return primary.result()
+
+    async def _get_once(self, url, params, priority, headers):
+        endpoint = upstream_endpoint(url)
+        if not breaker.allow():
+            logger.warning("%s: API недоступен", endpoint)
+            UPSTREAM_REQUESTS.inc(endpoint=endpoint, status="circuit_open")
+            return None, None, {}
+        if not await quota_scheduler.acquire_async(priority):
+            logger.warning("%s: исчерпана квота API", endpoint)
+            QUOTA_DENIED.inc(priority="background" if priority == BACKGROUND else "interactive")
+            return None, QUOTA_EXCEEDED_STATUS, {}
+        started = time.monotonic()
+        UPSTREAM_IN_FLIGHT.inc()
+        try:
+            async with self._get_session().get(url, params=params, headers=headers) as response:
+                UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=response.status)
+                body = await response.text() if response.status == 503 else ""
+                if body:
+                    await _in_thread(quota_scheduler.record, response.status, body)
+                if response.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                    hedge_policy.observe(time.monotonic() - started)
+                if response.status != 200:
+                    if response.status != NOT_MODIFIED_STATUS:
+                        logger.warning("%s: статус %s", endpoint, response.status)
+                    # 503 из-за квоты для вызывающих — тот же отказ, что и у планировщика
+                    if is_quota_response(response.status, body):
+                        return None, QUOTA_EXCEEDED_STATUS, response.headers
+                    return None, response.status, response.headers
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    data = None
+                return data, response.status, response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record_failure()
+            UPSTREAM_REQUESTS.inc(endpoint=endpoint, status="error")
+            logger.warning("Ошибка при запросе к API: %r", e)
+            return None, None, {}
+        finally:
+            UPSTREAM_IN_FLIGHT.dec()
+            UPSTREAM_SECONDS.observe(time.monotonic() - started, endpoint=endpoint)
+
+    async def resolve_location(self, city):
+        """Асинхронный аналог utls.main.resolve_location."""
+        if not city or not city.strip():
+            return None, 200
+
+        cache_key = _normalize_city(city)
+        location = await _cache_call(location_cache.get, cache_key)
+        if location is not None:
+            CACHE_LOOKUPS.inc(cache="location", result="hit")
+            return location, 200
+
+        entry = gazetteer.lookup(city)
+        if entry is not None and entry['key']:
+            CACHE_LOOKUPS.inc(cache="location", result="hit")
+            spatial_index.add(entry)
+            return entry, 200
+
+        stale = await _cache_call(location_cache.get_stale, cache_key)
+        if stale is not None and await _cache_call(quota_scheduler.is_low):
+            CACHE_LOOKUPS.inc(cache="location", result="stale")
+            return stale, 200
+
+        location, status_code = await self._flights.do(("location", cache_key), self._search_city, city, cache_key)
+        if location is None and stale is not None and api_unavailable(status_code):
+            CACHE_LOOKUPS.inc(cache="location", result="stale")
+            return stale, 200
+        CACHE_LOOKUPS.inc(cache="location", result="miss")
+        return location, status_code
+
+    async def _search_city(self, city, cache_key):
+        data, status_code, _ = await self._get_json(CITY_SEARCH_URL, {'apikey': self.api_key, 'q': city})
+        if not data:
+            return None, status_code
+
+        location = _parse_location(data[0])
+        await _cache_call(location_cache.set, cache_key, location)
+        learn_location(location)
+        spatial_index.add(location)
+        return location, status_code
+
+    async def fetch_daily_forecast(self, location_key, priority=INTERACTIVE):
+        """Асинхронный аналог utls.main.fetch_daily_forecast."""
+        if priority == INTERACTIVE:
+            forecast_refresher.touch(location_key)
+        payload = await _cache_call(forecast_cache.get, location_key)
+        if payload is not None:
+            CACHE_LOOKUPS.inc(cache="forecast", result="hit")
+            return payload, 200
+
+        flight_key = ("forecast", location_key)
+        stale = await _cache_call(forecast_cache.get_stale, location_key)
+        if stale is None:
+            CACHE_LOOKUPS.inc(cache="forecast", result="miss")
+            return await self._flights.do(flight_key, self._download_forecast, location_key, priority)
+
+        payload, status_code = await self._revalidate_forecast(location_key, priority)
+        if payload is None:
+            CACHE_LOOKUPS.inc(cache="forecast", result="stale")
+            return stale, STALE_STATUS
+        CACHE_LOOKUPS.inc(cache="forecast", result="miss")
+        return payload, status_code
+
+    async def _revalidate_forecast(self, location_key, priority):
+        flight_key = ("forecast", location_key)
+        if breaker.is_open() or self._flights.in_flight(flight_key) or await _cache_call(quota_scheduler.is_low):
+            return None, None
+
+        # Отмена ожидания по таймауту не отменяет само обновление (см. AsyncSingleFlight)
+        try:
+            return await asyncio.wait_for(
+                self._flights.do(flight_key, self._download_forecast, location_key, priority), STALE_REFRESH_WAIT)
+        except asyncio.TimeoutError:
+            return None, None
+
+    async def refresh_forecast(self, location_key):
+        """Асинхронный аналог utls.main.refresh_forecast."""
+        return await self._flights.do(("forecast", location_key), self._download_forecast, location_key, BACKGROUND)
+
+    async def _download_forecast(self, location_key, priority):
+        params = {"apikey": self.api_key, "details": "true", "metric": "true"}
+        previous = await _cache_call(forecast_cache.get_stale, location_key)
+        payload, status_code, headers = await self._get_json(
+            FORECAST_5DAY_URL + str(location_key), params, priority, conditional_headers(previous))
+        if status_code == NOT_MODIFIED_STATUS and previous is not None:
+            # Прогноз не изменился: продлеваем старый, тело не скачивалось
+            forecast = previous.with_validators(headers.get("ETag"), headers.get("Last-Modified"))
+        elif payload is None:
+            return None, status_code
+        else:
+            try:
+                forecast = Forecast.from_payload(payload, headers.get("ETag"), headers.get("Last-Modified"))
+            except (KeyError, TypeError, ValueError):
+                logger.warning("fetch_daily_forecast: не удалось разобрать ответ для %s", location_key)
+                return None, status_code
+
+        forecast_archive.record(location_key, forecast)
+        ttl = _cache_ttl(headers)
+        if ttl > 0:
+            await _cache_call(forecast_cache.set, location_key, forecast, ttl)
+        return forecast, 200
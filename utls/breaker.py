@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Сколько сбоев подряд (5xx, таймауты, ошибки сети) размыкают цепь
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+# Сколько секунд после размыкания запросы не отправляются совсем
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для вызовов внешнего API.
+
+    После failure_threshold сбоев подряд цепь размыкается, и запросы сразу
+    отклоняются, не дожидаясь таймаута. Через reset_timeout секунд пропускается
+    один пробный запрос: успех замыкает цепь, сбой снова размыкает её.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """Запросы сейчас отклоняются: цепь разомкнута и время пробного запроса не подошло."""
+        with self._lock:
+            return self._state != CLOSED and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self):
+        """Можно ли отправить запрос; после reset_timeout разрешает один пробный."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                # Если пробный запрос так и не отчитался, через reset_timeout пускаем следующий
+                self._state = HALF_OPEN
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning("Цепь к API разомкнута после %d сбоев", self._failures)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
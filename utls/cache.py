@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# memory — кэш в памяти процесса; sqlite — общий для всех процессов файл (воркеры gunicorn)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "weather_cache.sqlite3")
+
+logger = logging.getLogger(__name__)
+
+
+def shared_db(local, path=SHARED_CACHE_PATH):
+    """
+    Соединение с общей базой SQLite для текущего потока (хранится в local, threading.local).
+
+    Соединение на поток; после fork (воркеры gunicorn) открывается заново.
+    """
+    db = getattr(local, "db", None)
+    if db is None or local.pid != os.getpid():
+        db = sqlite3.connect(path, timeout=1, isolation_level=None)
+        db.execute("PRAGMA synchronous=NORMAL")
+        local.db, local.pid = db, os.getpid()
+    return db
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с ограниченным размером и временем жизни записей.
+
+    Args:
+        maxsize (int): Максимальное число записей, самые старые по использованию вытесняются.
+        ttl (float): Время жизни записи в секундах.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                # Просроченная запись остаётся до вытеснения, см. get_stale
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_stale(self, key, default=None):
+        """Возвращает значение даже если срок его жизни истёк."""
+        with self._lock:
+            item = self._data.get(key)
+            return default if item is None else item[0]
+
+    def expires_in(self, key):
+        """Сколько секунд осталось жить записи (отрицательное — уже просрочена), None — записи нет."""
+        with self._lock:
+            item = self._data.get(key)
+            return None if item is None else item[1] - time.monotonic()
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedTTLCache:
+    """
+    Кэш с интерфейсом TTLCache в файле SQLite (WAL), общий для всех процессов.
+
+    То, что запросил один воркер, сразу видят остальные. Значения хранятся в JSON
+    (через encode/decode, если они не сериализуются сами), время жизни
+    отсчитывается по часам системы. Вытесняются записи, дольше всех
+    не обновлявшиеся: чтение в базу не пишет, поэтому порядок — по записи, а не по
+    использованию. Ошибки базы (например, долгая блокировка) не роняют запрос:
+    кэш просто промахивается.
+
+    Args:
+        path (str): Файл базы.
+        name (str): Имя таблицы; у каждого кэша своя.
+        maxsize (int): Максимальное число записей.
+        ttl (float): Время жизни записи в секундах.
+        encode (callable): Значение -> объект, который понимает json; по умолчанию само значение.
+        decode (callable): Обратное к encode.
+    """
+
+    # Лишние записи удаляются раз в столько вызовов set, а не на каждом
+    EVICT_EVERY = 64
+
+    def __init__(self, path=SHARED_CACHE_PATH, name="cache", maxsize=1024, ttl=3600, encode=None, decode=None):
+        if not name.isidentifier():
+            raise ValueError(f"Недопустимое имя таблицы кэша: {name!r}")
+        self.path = path
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._encode = encode or (lambda value: value)
+        self._decode = decode or (lambda data: data)
+        self._local = threading.local()
+        self._sets = 0
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        db.execute(f"CREATE INDEX IF NOT EXISTS {name}_updated_at ON {name} (updated_at)")
+
+    def _db(self):
+        return shared_db(self._local, self.path)
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key, ensure_ascii=False)
+
+    def _row(self, key):
+        try:
+            row = self._db().execute(
+                f"SELECT value, expires_at FROM {self.name} WHERE key = ?", (self._key(key),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Кэш %s недоступен: %s", self.name, e)
+            return None
+        if row is None:
+            return None
+        try:
+            return self._decode(json.loads(row[0])), row[1]
+        except (ValueError, KeyError, TypeError, IndexError):
+            # Запись в старом формате (например, от предыдущей версии) — как промах
+            return None
+
+    def get(self, key, default=None):
+        row = self._row(key)
+        if row is None or row[1] <= time.time():
+            return default
+        return row[0]
+
+    def get_stale(self, key, default=None):
+        """Возвращает значение даже если срок его жизни истёк."""
+        row = self._row(key)
+        return default if row is None else row[0]
+
+    def expires_in(self, key):
+        """Сколько секунд осталось жить записи (отрицательное — уже просрочена), None — записи нет."""
+        row = self._row(key)
+        return None if row is None else row[1] - time.time()
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                (self._key(key), json.dumps(self._encode(value), ensure_ascii=False), now + ttl, now),
+            )
+            self._sets += 1
+            if self._sets % self.EVICT_EVERY == 0:
+                db.execute(
+                    f"DELETE FROM {self.name} WHERE key IN "
+                    f"(SELECT key FROM {self.name} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Не удалось записать в кэш %s: %s", self.name, e)
+
+    def pop(self, key, default=None):
+        row = self._row(key)
+        if row is None:
+            return default
+        try:
+            self._db().execute(f"DELETE FROM {self.name} WHERE key = ?", (self._key(key),))
+        except sqlite3.Error as e:
+            logger.warning("Не удалось удалить из кэша %s: %s", self.name, e)
+        return row[0]
+
+    def clear(self):
+        self._db().execute(f"DELETE FROM {self.name}")
+
+    def __len__(self):
+        return self._db().execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+
+def make_cache(name, maxsize, ttl, encode=None, decode=None):
+    """
+    Кэш с данными, которые можно делить между процессами, по настройке CACHE_BACKEND.
+
+    encode и decode нужны только общему кэшу, см. SharedTTLCache.
+    """
+    if CACHE_BACKEND == "sqlite":
+        return SharedTTLCache(SHARED_CACHE_PATH, name, maxsize, ttl, encode, decode)
+    if CACHE_BACKEND != "memory":
+        raise ValueError(f"Неизвестный CACHE_BACKEND: {CACHE_BACKEND!r}")
+    return TTLCache(maxsize, ttl)
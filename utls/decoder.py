@@ -0,0 +1,51 @@
+import numpy as np
+
+# Столбцы таблицы прогнозов в длинном формате: одна строка на локацию и день
+FORECAST_COLUMNS = [
+    "location", "day", "date", "temperature_min", "temperature", "wind_speed",
+    "precipitation", "has_precipitation", "link",
+]
+
+
+def decode_forecasts(forecasts):
+    """
+    Собирает прогнозы нескольких локаций в одну таблицу.
+
+    Каждый столбец собирается целиком из всех дней всех локаций, без построчного
+    добавления в DataFrame.
+
+    Args:
+        forecasts (dict): Метка локации (город, ключ и т.п.) -> utls.records.Forecast,
+            как его возвращает fetch_daily_forecast. Локации с None пропускаются.
+
+    Returns:
+        pandas.DataFrame: Столбцы FORECAST_COLUMNS; temperature — максимум за день,
+        precipitation — вероятность осадков днём в процентах, day — номер дня от 0.
+    """
+    # pandas импортируется при первом разборе, а не при старте процесса
+    import pandas as pd
+
+    labels = []
+    days = []
+    for label, forecast in forecasts.items():
+        if forecast is None:
+            continue
+        labels.append((label, len(forecast)))
+        days.extend(forecast)
+
+    total = len(days)
+    counts = np.fromiter((count for _, count in labels), dtype=np.int64, count=len(labels))
+    location = np.empty(len(labels), dtype=object)
+    location[:] = [label for label, _ in labels]
+
+    return pd.DataFrame({
+        "location": np.repeat(location, counts),
+        "day": np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts),
+        "date": np.array([day.date for day in days], dtype="datetime64[D]"),
+        "temperature_min": np.fromiter((day.temperature_min for day in days), dtype=float, count=total),
+        "temperature": np.fromiter((day.temperature for day in days), dtype=float, count=total),
+        "wind_speed": np.fromiter((day.wind_speed for day in days), dtype=float, count=total),
+        "precipitation": np.fromiter((day.precipitation for day in days), dtype=float, count=total),
+        "has_precipitation": np.fromiter((day.has_precipitation for day in days), dtype=bool, count=total),
+        "link": np.array([day.link for day in days], dtype=object),
+    }, columns=FORECAST_COLUMNS)
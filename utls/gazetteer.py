@@ -0,0 +1,270 @@
+import atexit
+import bisect
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from dotenv import load_dotenv
+
+from utls.cache import CACHE_BACKEND, shared_db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+GAZETTEER_FILE = os.getenv("GAZETTEER_FILE", os.path.join(_DATA_DIR, "cities.csv"))
+# Ключи AccuWeather, узнанные во время работы, чтобы не искать город повторно после перезапуска
+GAZETTEER_KEYS_FILE = os.getenv("GAZETTEER_KEYS_FILE", "gazetteer_keys.json")
+GAZETTEER_LEARNED_MAX = int(os.getenv("GAZETTEER_LEARNED_MAX", 10000))
+GAZETTEER_SAVE_DELAY = float(os.getenv("GAZETTEER_SAVE_DELAY", 5))
+
+
+def normalize(name):
+    return " ".join(name.lower().replace("ё", "е").replace("-", " ").split())
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a, b, limit):
+    # Левенштейн с отсечением: как только вся строка матрицы больше limit, дальше не считаем
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class Gazetteer:
+    """
+    Локальный справочник городов с поиском по точному имени, префиксу и с опечатками.
+
+    Записи имеют тот же вид, что и результат utls.main.resolve_location:
+    словарь с полями key, name, latitude, longitude (key может быть None,
+    пока город ни разу не искали в AccuWeather).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exact = {}
+        self._names = []
+        self._trigram_index = {}
+
+    def add(self, entry, aliases=()):
+        with self._lock:
+            for alias in (entry["name"], *aliases):
+                self._add_alias(normalize(alias), entry)
+
+    def _add_alias(self, alias, entry):
+        if not alias or alias in self._exact:
+            return
+        self._exact[alias] = entry
+        bisect.insort(self._names, alias)
+        for trigram in _trigrams(alias):
+            self._trigram_index.setdefault(trigram, set()).add(alias)
+
+    def load_csv(self, path):
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                entry = {
+                    'key': row['key'] or None,
+                    'name': row['name'],
+                    'latitude': float(row['latitude']),
+                    'longitude': float(row['longitude']),
+                }
+                aliases = [alias for alias in row['aliases'].split("|") if alias]
+                self.add(entry, aliases)
+
+    def entries(self):
+        """Все города справочника, каждый один раз."""
+        with self._lock:
+            return list({id(entry): entry for entry in self._exact.values()}.values())
+
+    def lookup(self, query):
+        """
+        Город по точному имени или псевдониму.
+
+        Для поиска города по запросу пользователя — только так: поиск с опечатками
+        (fuzzy, complete) годится лишь для подсказок, иначе «Орск» становится Омском.
+        """
+        return self._exact.get(normalize(query))
+
+    def prefix(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        names = self._names
+        start = bisect.bisect_left(names, query)
+        result = []
+        for name in names[start:]:
+            if not name.startswith(query) or len(result) >= limit:
+                break
+            entry = self._exact[name]
+            if entry not in result:
+                result.append(entry)
+        return result
+
+    def fuzzy(self, query, max_distance=None, limit=10):
+        """Города, имя или псевдоним которых отличается от запроса не больше чем на max_distance правок."""
+        query = normalize(query)
+        if not query:
+            return []
+        if max_distance is None:
+            max_distance = 1 if len(query) < 6 else 2
+
+        candidates = {}
+        for trigram in _trigrams(query):
+            for name in self._trigram_index.get(trigram, ()):
+                candidates[name] = candidates.get(name, 0) + 1
+
+        scored = []
+        for name, _ in sorted(candidates.items(), key=lambda item: -item[1])[:200]:
+            distance = _edit_distance(query, name, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, name))
+        scored.sort()
+
+        result = []
+        for _, name in scored:
+            entry = self._exact[name]
+            if entry not in result:
+                result.append(entry)
+            if len(result) >= limit:
+                break
+        return result
+
+    def complete(self, query, limit=10):
+        """Подсказки для автодополнения: сначала по префиксу, затем с опечатками."""
+        result = self.prefix(query, limit)
+        if len(result) < limit:
+            for entry in self.fuzzy(query, limit=limit):
+                if entry not in result:
+                    result.append(entry)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def remember(self, location):
+        """
+        Запоминает найденный в AccuWeather город и его ключ под его собственным именем.
+
+        Returns:
+            bool: True, если справочник изменился.
+        """
+        name = normalize(location['name'])
+        with self._lock:
+            entry = self._exact.get(name)
+            if entry is None:
+                self._add_alias(name, dict(location))
+                return True
+            # Одноимённый город с другим ключом не подменяет уже известный
+            if entry['key'] is None:
+                entry['key'] = location['key']
+                return True
+            return False
+
+
+_db_local = threading.local()
+
+
+def _learned_db():
+    # При CACHE_BACKEND=sqlite узнанные города хранятся в общей базе: каждый процесс
+    # дописывает свои строки, и ничего не теряется, как при перезаписи файла
+    db = shared_db(_db_local)
+    db.execute("CREATE TABLE IF NOT EXISTS learned_cities (name TEXT PRIMARY KEY, location TEXT NOT NULL)")
+    return db
+
+
+def _load_learned():
+    try:
+        with open(GAZETTEER_KEYS_FILE, encoding="utf-8") as f:
+            learned = json.load(f)
+    except (OSError, ValueError):
+        learned = {}
+    if CACHE_BACKEND == "sqlite":
+        try:
+            rows = _learned_db().execute("SELECT name, location FROM learned_cities").fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Не удалось загрузить узнанные города: %s", e)
+        else:
+            learned.update((name, json.loads(location)) for name, location in rows)
+    return learned
+
+
+def _load_default():
+    result = Gazetteer()
+    try:
+        result.load_csv(GAZETTEER_FILE)
+    except OSError as e:
+        logger.warning("Не удалось загрузить справочник городов: %s", e)
+    for location in _learned.values():
+        result.remember(location)
+    return result
+
+
+_learned = _load_learned()
+_learned_lock = threading.Lock()
+_save_timer = None
+gazetteer = _load_default()
+
+
+def learn(location):
+    """
+    Запоминает найденный город в справочнике и в файле GAZETTEER_KEYS_FILE
+    (при CACHE_BACKEND=sqlite — в общей базе).
+
+    В файле — только имя города и его данные, не запрос пользователя, и не
+    больше GAZETTEER_LEARNED_MAX городов. Файл пишется в фоне, раз в
+    GAZETTEER_SAVE_DELAY секунд после изменений, а не на каждый запрос.
+    """
+    global _save_timer
+    if not gazetteer.remember(location):
+        return
+    with _learned_lock:
+        name = normalize(location['name'])
+        if name not in _learned and len(_learned) >= GAZETTEER_LEARNED_MAX:
+            return
+        _learned[name] = location
+        # После fork таймер родителя в потомке не работает: is_alive() вернёт False
+        if _save_timer is None or not _save_timer.is_alive():
+            _save_timer = threading.Timer(GAZETTEER_SAVE_DELAY, save_learned)
+            _save_timer.daemon = True
+            _save_timer.start()
+
+
+def save_learned():
+    """Сохраняет узнанные города, дописывая к ним то, что успели сохранить другие процессы."""
+    if CACHE_BACKEND == "sqlite":
+        with _learned_lock:
+            rows = [(name, json.dumps(location, ensure_ascii=False)) for name, location in _learned.items()]
+        try:
+            _learned_db().executemany("INSERT OR IGNORE INTO learned_cities (name, location) VALUES (?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.warning("Не удалось сохранить справочник городов: %s", e)
+        return
+    with _learned_lock:
+        for name, location in _load_learned().items():
+            _learned.setdefault(name, location)
+        learned = dict(list(_learned.items())[:GAZETTEER_LEARNED_MAX])
+    tmp_path = f"{GAZETTEER_KEYS_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(learned, f, ensure_ascii=False)
+        os.replace(tmp_path, GAZETTEER_KEYS_FILE)
+    except OSError as e:
+        logger.warning("Не удалось сохранить справочник городов: %s", e)
+
+
+atexit.register(save_learned)
@@ -0,0 +1,248 @@
+import math
+import threading
+
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {char: i for i, char in enumerate(_BASE32)}
+EARTH_RADIUS_KM = 6371.0
+
+
+def geohash_encode(latitude, longitude, precision=5):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """Возвращает (min_lat, max_lat, min_lon, max_lon) ячейки."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if value >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_neighbors(geohash):
+    """Сама ячейка и восемь соседних той же точности."""
+    min_lat, max_lat, min_lon, max_lon = geohash_bounds(geohash)
+    lat_step = max_lat - min_lat
+    lon_step = max_lon - min_lon
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+    cells = set()
+    for d_lat in (-1, 0, 1):
+        latitude = center_lat + d_lat * lat_step
+        if not -90 <= latitude <= 90:
+            continue
+        for d_lon in (-1, 0, 1):
+            longitude = (center_lon + d_lon * lon_step + 180) % 360 - 180
+            cells.add(geohash_encode(latitude, longitude, len(geohash)))
+    return cells
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def geohash_encode_many(latitudes, longitudes, precision=5):
+    """
+    Векторная версия geohash_encode.
+
+    Returns:
+        numpy.ndarray: Целочисленные коды ячеек (одинаковый код — одна ячейка);
+        строку geohash для кода даёт geohash_from_code.
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    lat = np.clip((np.asarray(latitudes, dtype=float) + 90) / 180, 0, 1 - 1e-12)
+    lon = np.clip((np.asarray(longitudes, dtype=float) + 180) / 360, 0, 1 - 1e-12)
+    lat_int = (lat * (1 << lat_bits)).astype(np.int64)
+    lon_int = (lon * (1 << lon_bits)).astype(np.int64)
+    codes = np.zeros(lat_int.shape, dtype=np.int64)
+    # Биты чередуются начиная с долготы, старшие биты первыми
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (lon_int >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_int >> (lat_bits - 1 - i // 2)) & 1
+        codes = (codes << 1) | bit
+    return codes
+
+
+def geohash_from_code(code, precision=5):
+    return "".join(_BASE32[(int(code) >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def precision_for_km(km):
+    """Самая мелкая точность geohash, ячейка которой по широте не меньше km."""
+    for precision in range(12, 0, -1):
+        lat_bits = 5 * precision // 2
+        if 180 / (1 << lat_bits) * math.pi / 180 * EARTH_RADIUS_KM >= km:
+            return precision
+    return 1
+
+
+def sample_great_circle(points, step_km):
+    """
+    Точки вдоль дуг большого круга между соседними путевыми точками.
+
+    Args:
+        points: Массив (n, 2) широт и долгот в градусах.
+        step_km (float): Шаг между соседними точками, в километрах.
+
+    Returns:
+        numpy.ndarray: Массив (m, 2) широт и долгот, начиная с первой и заканчивая
+        последней путевой точкой; все путевые точки входят в него.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return points.copy()
+
+    lat = np.radians(points[:, 0])
+    lon = np.radians(points[:, 1])
+    xyz = np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+    start, end = xyz[:-1], xyz[1:]
+    angle = np.arccos(np.clip(np.einsum("ij,ij->i", start, end), -1, 1))
+
+    # Число отрезков на каждом участке и доля пути для каждой точки
+    counts = np.maximum(1, np.ceil(angle * EARTH_RADIUS_KM / step_km)).astype(np.int64)
+    segment = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = offsets / counts[segment]
+
+    # Сферическая интерполяция; для совпадающих точек — линейная
+    omega = angle[segment]
+    sin_omega = np.sin(omega)
+    degenerate = sin_omega < 1e-12
+    safe_sin = np.where(degenerate, 1.0, sin_omega)
+    weight_start = np.where(degenerate, 1 - fraction, np.sin((1 - fraction) * omega) / safe_sin)
+    weight_end = np.where(degenerate, fraction, np.sin(fraction * omega) / safe_sin)
+    samples = weight_start[:, None] * start[segment] + weight_end[:, None] * end[segment]
+    samples = np.vstack((samples, xyz[-1:]))
+    samples /= np.linalg.norm(samples, axis=1)[:, None]
+
+    return np.column_stack((
+        np.degrees(np.arcsin(np.clip(samples[:, 2], -1, 1))),
+        np.degrees(np.arctan2(samples[:, 1], samples[:, 0])),
+    ))
+
+
+def sample_route_cells(points, step_km, precision=5):
+    """
+    Сэмплирует маршрут и оставляет по одной точке на ячейку geohash.
+
+    Returns:
+        tuple: (path, cells). path — массив (m, 2) всех точек для отрисовки;
+        cells — список словарей latitude, longitude, cell для различных ячеек
+        в порядке следования по маршруту.
+    """
+    path = sample_great_circle(points, step_km)
+    if not len(path):
+        return path, []
+    codes = geohash_encode_many(path[:, 0], path[:, 1], precision)
+    _, first_index = np.unique(codes, return_index=True)
+    first_index.sort()
+    cells = [
+        {
+            'latitude': float(path[i, 0]),
+            'longitude': float(path[i, 1]),
+            'cell': geohash_from_code(codes[i], precision),
+        }
+        for i in first_index
+    ]
+    return path, cells
+
+
+class SpatialIndex:
+    """
+    Индекс известных локаций по ячейкам geohash.
+
+    Точки в одной ячейке (или рядом, см. nearest) используют одну локацию
+    AccuWeather, а значит и один закэшированный прогноз.
+
+    Args:
+        precision (int): Длина geohash; 5 — ячейки около 5×5 км, 4 — около 40×20 км.
+    """
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def cell(self, latitude, longitude):
+        return geohash_encode(latitude, longitude, self.precision)
+
+    def add(self, location, latitude=None, longitude=None):
+        """
+        Добавляет локацию в индекс.
+
+        Если заданы latitude и longitude, локация индексируется ещё и по этой
+        точке: так точка запроса, для которой API вернул удалённый от неё центр
+        города, в следующий раз найдётся без запроса.
+        """
+        if latitude is None or longitude is None:
+            latitude, longitude = location['latitude'], location['longitude']
+        cell = self.cell(latitude, longitude)
+        with self._lock:
+            points = self._cells.setdefault(cell, [])
+            if all(known['key'] != location['key'] for _, _, known in points):
+                points.append((latitude, longitude, location))
+
+    def nearest(self, latitude, longitude, max_km=None):
+        """
+        Ближайшая известная локация в ячейке точки и соседних с ней.
+
+        Args:
+            max_km (float): Не дальше этого расстояния; None — любая из просмотренных ячеек.
+
+        Returns:
+            dict: Локация или None, если рядом ничего не известно.
+        """
+        best = None
+        best_distance = None
+        with self._lock:
+            for cell in geohash_neighbors(self.cell(latitude, longitude)):
+                for point_lat, point_lon, location in self._cells.get(cell, ()):
+                    distance = haversine_km(latitude, longitude, point_lat, point_lon)
+                    if best_distance is None or distance < best_distance:
+                        best, best_distance = location, distance
+        if best is None or (max_km is not None and best_distance > max_km):
+            return None
+        return best
+
+    def __len__(self):
+        return sum(len(points) for points in self._cells.values())
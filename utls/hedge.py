@@ -0,0 +1,114 @@
+import math
+import os
+import random
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Дублировать медленные запросы пользователей; каждый дубль тратит квоту, поэтому по умолчанию выключено
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0").lower() in ("1", "true", "yes")
+# Дубль отправляется, когда запрос идёт дольше этого перцентиля наблюдаемых задержек
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0.95))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.05))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", 5))
+# Пока наблюдений меньше, порог неизвестен и дубли не отправляются
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+
+# Повторы после сетевых ошибок и 5xx (кроме 503 — это исчерпанная квота AccuWeather)
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", 1))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.2))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 2))
+RETRY_STATUSES = (500, 502, 504)
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами от min_value до max_value секунд.
+
+    Когда наблюдений становится больше max_count, все счётчики делятся пополам,
+    так что перцентили следят за текущим поведением API, а не за средним за всё время.
+    """
+
+    def __init__(self, min_value=0.001, max_value=60.0, buckets_per_doubling=4, max_count=10000):
+        self.min_value = min_value
+        self.growth = 2 ** (1 / buckets_per_doubling)
+        size = int(math.ceil(math.log(max_value / min_value, self.growth))) + 1
+        self.bounds = [min_value * self.growth ** i for i in range(size)]
+        self.max_count = max_count
+        self._counts = [0] * size
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _index(self, value):
+        if value <= self.min_value:
+            return 0
+        return min(len(self.bounds) - 1, int(math.ceil(math.log(value / self.min_value, self.growth))))
+
+    def observe(self, value):
+        index = self._index(value)
+        with self._lock:
+            self._counts[index] += 1
+            self._total += 1
+            if self._total > self.max_count:
+                self._counts = [count // 2 for count in self._counts]
+                self._total = sum(self._counts)
+
+    def count(self):
+        return self._total
+
+    def percentile(self, q):
+        """Верхняя граница корзины, в которую попадает q-я доля наблюдений; None, если их нет."""
+        with self._lock:
+            if not self._total:
+                return None
+            threshold = q * self._total
+            seen = 0
+            for bound, count in zip(self.bounds, self._counts):
+                seen += count
+                if seen >= threshold:
+                    return bound
+            return self.bounds[-1]
+
+
+class HedgePolicy:
+    """
+    Когда дублировать и когда повторять идемпотентные GET-запросы к API.
+
+    Порог дублирования берётся из гистограммы задержек успешных ответов, которую
+    наполняют сами клиенты через observe.
+    """
+
+    def __init__(self, enabled=HEDGE_REQUESTS, percentile=HEDGE_PERCENTILE, min_delay=HEDGE_MIN_DELAY,
+                 max_delay=HEDGE_MAX_DELAY, min_samples=HEDGE_MIN_SAMPLES, retry_attempts=RETRY_ATTEMPTS,
+                 retry_base_delay=RETRY_BASE_DELAY, retry_max_delay=RETRY_MAX_DELAY):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.latency = LatencyHistogram()
+
+    def observe(self, seconds):
+        self.latency.observe(seconds)
+
+    def hedge_delay(self):
+        """Через сколько секунд отправлять дубль; None — не дублировать."""
+        if not self.enabled or self.latency.count() < self.min_samples:
+            return None
+        return min(self.max_delay, max(self.min_delay, self.latency.percentile(self.percentile)))
+
+    def should_retry(self, status_code):
+        # status_code None — сетевая ошибка или таймаут
+        return status_code is None or status_code in RETRY_STATUSES
+
+    def backoff(self, attempt):
+        """Пауза перед повтором номер attempt (с нуля): экспонента с полным джиттером."""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+
+hedge_policy = HedgePolicy()
@@ -0,0 +1,75 @@
+"""
+Условные ответы веб-приложения: ETag по содержимому прогноза и 304 Not Modified.
+
+Обработчик, результат которого зависит только от прогнозов, вызывает
+check_etag с их отпечатками (Forecast.digest) ещё до разбора, оценки и
+отрисовки: если у клиента та же версия, сразу возвращается 304. Остальным
+GET-ответам init_http_caching ставит ETag по телу, чтобы повторная загрузка
+хотя бы не передавала его заново.
+"""
+import hashlib
+import json
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Версия приложения входит в ETag: после выката со старыми шаблонами 304 не придёт.
+# По умолчанию — время изменения шаблонов
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def _default_build_id():
+    try:
+        names = sorted(os.listdir(TEMPLATES_DIR))
+    except FileNotFoundError:
+        return ""
+    return ",".join(f"{name}:{os.path.getmtime(os.path.join(TEMPLATES_DIR, name)):.0f}" for name in names)
+
+
+BUILD_ID = os.getenv("BUILD_ID") or _default_build_id()
+
+
+def content_etag(*parts):
+    """ETag из частей, от которых зависит ответ (строки, числа, списки)."""
+    data = json.dumps([BUILD_ID, *parts], ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:20]
+
+
+def check_etag(*parts):
+    """
+    Запоминает ETag текущего ответа и сверяет его с If-None-Match.
+
+    Returns:
+        flask.Response | None: Готовый ответ 304, если у клиента та же версия; иначе None.
+    """
+    from flask import Response, g, request
+
+    g.etag = content_etag(*parts)
+    if request.if_none_match.contains(g.etag):
+        response = Response(status=304)
+        response.set_etag(g.etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return None
+
+
+def init_http_caching(app):
+    """Ставит ETag на успешные GET-ответы и отвечает 304 на совпавший If-None-Match."""
+    from flask import g, request
+
+    @app.after_request
+    def _add_etag(response):
+        if request.method not in ("GET", "HEAD") or response.status_code != 200 or response.is_streamed:
+            return response
+        etag = g.pop("etag", None)
+        if etag is not None:
+            response.set_etag(etag)
+        elif "ETag" not in response.headers:
+            response.add_etag()
+        else:
+            return response.make_conditional(request)
+        # Браузер хранит ответ, но каждый раз сверяется с сервером: прогноз может обновиться
+        response.headers.setdefault("Cache-Control", "private, no-cache")
+        return response.make_conditional(request)
@@ -1,119 +1,709 @@
-import pandas as pd
-from datetime import datetime
+import requests
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+
+from utls.archive import forecast_archive
+from utls.cache import make_cache
+from utls.decoder import decode_forecasts
+from utls.records import Forecast
+from utls.singleflight import SingleFlight
+from utls.gazetteer import gazetteer, learn as learn_location
+from utls.geo import SpatialIndex, geohash_encode, haversine_km, precision_for_km, sample_route_cells
+from utls.prefetch import RefreshAhead
+from utls.breaker import breaker, CircuitOpen
+from utls.hedge import hedge_policy
+from utls.metrics import (
+    UPSTREAM_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_IN_FLIGHT, CACHE_LOOKUPS, QUOTA_REMAINING, QUOTA_DENIED,
+    BREAKER_OPEN,
+)
+from utls.quota import (
+    scheduler as quota_scheduler, QuotaExceeded, INTERACTIVE, BACKGROUND,
+    QUOTA_EXCEEDED_STATUS, QUOTA_EXCEEDED_CODES, is_quota_response,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Получение API_KEY
 API_KEY = os.getenv("API_KEY")
 
-def get_forecast(location_str, api_key):
-    location_key = get_location_key(location_str, api_key)
-    response = get_daily_forecast(location_key, api_key)
+# Можно направить на локальную заглушку (bench/fake_accuweather.py), чтобы не тратить квоту
+ACCUWEATHER_BASE_URL = os.getenv("ACCUWEATHER_BASE_URL", "http://dataservice.accuweather.com").rstrip("/")
+CITY_SEARCH_URL = f"{ACCUWEATHER_BASE_URL}/locations/v1/cities/search"
+GEOPOSITION_SEARCH_URL = f"{ACCUWEATHER_BASE_URL}/locations/v1/cities/geoposition/search"
+FORECAST_5DAY_URL = f"{ACCUWEATHER_BASE_URL}/forecasts/v1/daily/5day/"
+CURRENT_CONDITIONS_URL = f"{ACCUWEATHER_BASE_URL}/currentconditions/v1/"
+CONNECTION_ERROR_CODES = (401, 403, 501, 503)
+# Статус ответа из кэша, срок жизни которого истёк (как 203 у HTTP-прокси)
+STALE_STATUS = 203
+# Ответ на условный запрос: прогноз не изменился
+NOT_MODIFIED_STATUS = 304
+
+# Таймауты одного запроса к API: на соединение и на чтение ответа
+CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT", 3))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 10))
+# Сколько ждать обновления просроченного прогноза, прежде чем отдать старый
+STALE_REFRESH_WAIT = float(os.getenv("STALE_REFRESH_WAIT", 1))
+
+# Кэш результатов поиска городов: общий для Flask, Dash и бота; при CACHE_BACKEND=sqlite — для всех процессов
+LOCATION_CACHE_SIZE = int(os.getenv("LOCATION_CACHE_SIZE", 4096))
+LOCATION_CACHE_TTL = int(os.getenv("LOCATION_CACHE_TTL", 24 * 60 * 60))
+location_cache = make_cache("locations", LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL)
+
+# Кэш 5-дневного прогноза (utls.records.Forecast) по ключу локации; срок жизни берётся из заголовков ответа
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 4096))
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", 30 * 60))
+forecast_cache = make_cache("forecasts", FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL,
+                            encode=Forecast.to_json, decode=Forecast.from_json)
+# Популярные прогнозы обновляются в фоне до истечения, см. start_forecast_refresher
+forecast_refresher = RefreshAhead(forecast_cache)
+
+# Точки в одной ячейке geohash разделяют одну локацию AccuWeather и её прогноз
+GEOHASH_PRECISION = int(os.getenv("GEOHASH_PRECISION", 5))
+SNAP_DISTANCE_KM = float(os.getenv("SNAP_DISTANCE_KM", 5))
+spatial_index = SpatialIndex(GEOHASH_PRECISION)
+
+# Промежуточные точки маршрута: шаг вдоль дуги и предел числа запрашиваемых ячеек.
+# Каждая точка без известного рядом города стоит двух запросов к API (поиск по
+# координатам и прогноз), поэтому их немного и они идут с фоновым приоритетом
+ROUTE_SAMPLE_STEP_KM = float(os.getenv("ROUTE_SAMPLE_STEP_KM", 100))
+ROUTE_MAX_SAMPLES = int(os.getenv("ROUTE_MAX_SAMPLES", 3))
+
+# Общий пул для параллельного разрешения точек маршрута; его размер ограничивает
+# число одновременных запросов к API
+ROUTE_CONCURRENCY = int(os.getenv("ROUTE_CONCURRENCY", 8))
+ROUTE_TIMEOUT = float(os.getenv("ROUTE_TIMEOUT", 10))
+# Сколько городов списка iter_city_forecasts держит в пуле маршрутов одновременно:
+# половина пула остаётся одиночным маршрутам
+CITY_BATCH_CONCURRENCY = max(1, int(os.getenv("CITY_BATCH_CONCURRENCY", ROUTE_CONCURRENCY // 2)))
+_route_executor = ThreadPoolExecutor(max_workers=ROUTE_CONCURRENCY, thread_name_prefix="route")
+# Отдельный пул для обновления просроченных прогнозов, чтобы не занимать пул маршрутов
+_refresh_executor = ThreadPoolExecutor(max_workers=ROUTE_CONCURRENCY, thread_name_prefix="refresh")
+# Пул для исходных запросов и их дублей при дублировании медленных запросов
+_hedge_executor = ThreadPoolExecutor(max_workers=2 * ROUTE_CONCURRENCY, thread_name_prefix="hedge")
+
+# Одинаковые одновременные запросы к API ждут один общий вызов
+_flights = SingleFlight()
+
+QUOTA_REMAINING.set_function(quota_scheduler.budget.remaining)
+BREAKER_OPEN.set_function(lambda: int(breaker.is_open()))
+
+
+def upstream_endpoint(url):
+    """Короткое имя эндпоинта AccuWeather для меток метрик."""
+    for prefix, name in ((CITY_SEARCH_URL, "cities_search"), (GEOPOSITION_SEARCH_URL, "geoposition_search"),
+                         (FORECAST_5DAY_URL, "forecast_5day"), (CURRENT_CONDITIONS_URL, "current_conditions")):
+        if url.startswith(prefix):
+            return name
+    return "other"
+
+
+def accuweather_get(url, params, priority=INTERACTIVE, headers=None):
+    """
+    Единая точка выхода к AccuWeather: каждый запрос проходит через предохранитель
+    и планировщик квоты и ограничен таймаутами.
+
+    Сетевые ошибки и 5xx повторяются с экспоненциальной паузой; медленные запросы
+    пользователей при включённом HEDGE_REQUESTS дублируются (см. utls.hedge).
+    headers — дополнительные заголовки запроса, например условного (conditional_headers).
+
+    Raises:
+        CircuitOpen: Цепь разомкнута после серии сбоев, запрос не отправлялся.
+        QuotaExceeded: Планировщик не выдал разрешение (лимит частоты или дневной квоты).
+        requests.exceptions.RequestException: Ошибка сети или таймаут.
+    """
+    attempt = 0
+    while True:
+        try:
+            response = _hedged_get(url, params, priority, headers)
+        except requests.exceptions.RequestException:
+            if attempt >= hedge_policy.retry_attempts or breaker.is_open():
+                raise
+        else:
+            if (attempt >= hedge_policy.retry_attempts or breaker.is_open()
+                    or not hedge_policy.should_retry(response.status_code)):
+                return response
+        time.sleep(hedge_policy.backoff(attempt))
+        attempt += 1
+
+
+def _hedged_get(url, params, priority, headers):
+    delay = hedge_policy.hedge_delay() if priority == INTERACTIVE else None
+    if delay is None:
+        return _single_get(url, params, priority, headers)
+
+    primary = _hedge_executor.submit(_single_get, url, params, priority, headers)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+
+    # Дубль идёт с фоновым приоритетом: он тратит квоту, но не резерв пользователей
+    # и не ждёт токенов; если квоты нет, просто дожидаемся исходного запроса
+    hedge = _hedge_executor.submit(_single_get, url, params, BACKGROUND, headers)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    return primary.result()
+
+
+def _single_get(url, params, priority, headers):
+    endpoint = upstream_endpoint(url)
+    if not breaker.allow():
+        UPSTREAM_REQUESTS.inc(endpoint=endpoint, status="circuit_open")
+        raise CircuitOpen(url)
+    if not quota_scheduler.acquire(priority):
+        QUOTA_DENIED.inc(priority="background" if priority == BACKGROUND else "interactive")
+        raise QuotaExceeded(url)
+    started = time.monotonic()
+    UPSTREAM_IN_FLIGHT.inc()
+    try:
+        response = requests.get(url, params=params, headers=headers, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT))
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        UPSTREAM_REQUESTS.inc(endpoint=endpoint, status="error")
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.dec()
+        UPSTREAM_SECONDS.observe(time.monotonic() - started, endpoint=endpoint)
+    UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    quota_scheduler.record(response.status_code, response.text if response.status_code == 503 else "")
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+        hedge_policy.observe(time.monotonic() - started)
     return response
-def get_weather_data(city, days):
-    location_key = get_location_key(city,  API_KEY)
-    url = f"http://dataservice.accuweather.com/forecasts/v1/daily/5day/{location_key}?apikey={API_KEY}&metric=true&details=true"
-    response = requests.get(url)
 
-    if response.status_code != 200:
-        print(
-            f"Error: get_weather_data {response.status_code}"
-        )
-        return None
 
-    forecast_data = response.json()["DailyForecasts"]
-
-    dates = []
-    temperatures = []
-    wind_speeds = []
-    precipitations = []
-
-    for day in forecast_data:
-        date = datetime.strptime(day["Date"][:10], "%Y-%m-%d")
-        temperature = day["Temperature"]["Maximum"]["Value"]
-        wind_speed = day["Day"]["Wind"]["Speed"]["Value"]
-        precipitation = day["Day"].get("PrecipitationProbability", 0)
-        if len(dates) < days:
-            dates.append(date)
-            temperatures.append(temperature)
-            wind_speeds.append(wind_speed)
-            precipitations.append(precipitation)
-
-    data = {
-        "date": dates[:days:],
-        "temperature": temperatures[:days:],
-        "wind_speed": wind_speeds[:days:],
-        "precipitation": precipitations[:days:],
+def error_status(response):
+    """Статус неудачного ответа для вызывающих: 503 из-за квоты — QUOTA_EXCEEDED_STATUS."""
+    if is_quota_response(response.status_code, response.text):
+        return QUOTA_EXCEEDED_STATUS
+    return response.status_code
+
+
+def api_unavailable(status_code):
+    """Ответа нет из-за сети, квоты или сбоя API — можно отдать устаревшие данные."""
+    return status_code is None or status_code in QUOTA_EXCEEDED_CODES or status_code >= 500
+
+
+def _normalize_city(city):
+    return " ".join(city.split()).lower()
+
+
+def _parse_location(data):
+    return {
+        'key': data['Key'],
+        'name': data['LocalizedName'],
+        'latitude': data['GeoPosition']['Latitude'],
+        'longitude': data['GeoPosition']['Longitude'],
     }
 
-    return pd.DataFrame(data)
 
+def resolve_location(city, api_key=API_KEY):
+    """
+    Находит город одним запросом к cities/search и кэширует результат.
 
-import requests
+    Args:
+        city (str): Название города.
+        api_key (str): Ключ AccuWeather.
 
+    Returns:
+        tuple: (location, status_code). location — словарь с полями key, name,
+        latitude, longitude или None, если город не найден; status_code равен
+        None, если до API не удалось достучаться.
+    """
+    if not city or not city.strip():
+        return None, 200
 
-def get_city_coordinates(city_name):
+    cache_key = _normalize_city(city)
+    location = location_cache.get(cache_key)
+    if location is not None:
+        CACHE_LOOKUPS.inc(cache="location", result="hit")
+        return location, 200
+
+    # Город из локального справочника с уже известным ключом не требует запроса
+    # (только точное имя или псевдоним, см. Gazetteer.lookup)
+    entry = gazetteer.lookup(city)
+    if entry is not None and entry['key']:
+        CACHE_LOOKUPS.inc(cache="location", result="hit")
+        spatial_index.add(entry)
+        return entry, 200
+
+    # При почти исчерпанной квоте довольствуемся устаревшей записью
+    stale = location_cache.get_stale(cache_key)
+    if stale is not None and quota_scheduler.is_low():
+        CACHE_LOOKUPS.inc(cache="location", result="stale")
+        return stale, 200
 
-    url = f"http://dataservice.accuweather.com/locations/v1/cities/search?apikey={API_KEY}&q={city_name}"
-    print(url)
+    location, status_code = _flights.do(("location", cache_key), _search_city, city, cache_key, api_key)
+    if location is None and stale is not None and api_unavailable(status_code):
+        CACHE_LOOKUPS.inc(cache="location", result="stale")
+        return stale, 200
+    CACHE_LOOKUPS.inc(cache="location", result="miss")
+    return location, status_code
 
-    response = requests.get(url)
+
+def _search_city(city, cache_key, api_key):
+    try:
+        response = accuweather_get(CITY_SEARCH_URL, {'apikey': api_key, 'q': city})
+    except QuotaExceeded:
+        logger.warning("Ошибка при поиске города: исчерпана квота API")
+        return None, QUOTA_EXCEEDED_STATUS
+    except CircuitOpen:
+        logger.warning("Ошибка при поиске города: API недоступен")
+        return None, None
+    except requests.exceptions.RequestException as e:
+        logger.warning("Ошибка при поиске города: %s", e)
+        return None, None
 
     if response.status_code != 200:
-        print(
-            f"Error: get_city_coordinates {response.status_code}"
-        )
-        return None
+        logger.warning("resolve_location: статус %s", response.status_code)
+        return None, error_status(response)
 
-    location_data = response.json()
+    try:
+        data = response.json()
+    except ValueError:
+        return None, response.status_code
+    if not data:
+        logger.info("Город не найден: %s", city)
+        return None, response.status_code
 
-    if not location_data:
-        print("Город не найден")
-        return None
+    location = _parse_location(data[0])
+    location_cache.set(cache_key, location)
+    learn_location(location)
+    spatial_index.add(location)
+    return location, response.status_code
 
-    latitude = location_data[0]["GeoPosition"]["Latitude"]
-    longitude = location_data[0]["GeoPosition"]["Longitude"]
 
-    return (latitude, longitude)
+def resolve_coordinates(latitude, longitude, api_key=API_KEY, max_km=SNAP_DISTANCE_KM, priority=INTERACTIVE):
+    """
+    Находит локацию AccuWeather для точки по координатам.
 
+    Если рядом (в той же или соседней ячейке geohash, не дальше max_km) уже есть
+    известная локация, точка привязывается к ней без запроса к API.
+
+    Returns:
+        tuple: (location, status_code), как у resolve_location.
+    """
+    location = spatial_index.nearest(latitude, longitude, max_km)
+    if location is not None:
+        return location, 200
+    cell = spatial_index.cell(latitude, longitude)
+    # Ячейку мог уже найти другой процесс, если кэш общий
+    location = location_cache.get(("geoposition", cell))
+    if location is not None:
+        spatial_index.add(location)
+        spatial_index.add(location, latitude, longitude)
+        return location, 200
+    return _flights.do(("geoposition", cell), _search_geoposition, latitude, longitude, api_key, priority)
 
-def get_daily_forecast(location_key, api_key):
-    params = {
-            "apikey": api_key,
-            "details": "true",
-            "metric": "true"}
-    #url = f"http://dataservice.accuweather.com/forecasts/v1/daily/1day/{location_key}"
-    url = f"http://dataservice.accuweather.com/currentconditions/v1/daily/5day/{location_key}"
 
+def _search_geoposition(latitude, longitude, api_key, priority):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        #daily_forecast = data["DailyForecasts"][0]
-        return data
+        response = accuweather_get(GEOPOSITION_SEARCH_URL, {'apikey': api_key, 'q': f"{latitude},{longitude}"},
+                                   priority)
+    except QuotaExceeded:
+        logger.warning("Ошибка при поиске по координатам: исчерпана квота API")
+        return None, QUOTA_EXCEEDED_STATUS
+    except CircuitOpen:
+        logger.warning("Ошибка при поиске по координатам: API недоступен")
+        return None, None
     except requests.exceptions.RequestException as e:
-        print(f"Ошибка при получении прогноза погоды: {e}")
-        return None
+        logger.warning("Ошибка при поиске по координатам: %s", e)
+        return None, None
 
-def get_location_key(location, api_key):
-    params = {
-        'apikey': api_key,
-        'q': location
-    }
-    # url = f"http://dataservice.accuweather.com/locations/v1/cities/search"
-    url = f'http://dataservice.accuweather.com/locations/v1/cities/search?apikey={api_key}&q={location}'
+    if response.status_code != 200:
+        logger.warning("resolve_coordinates: статус %s", response.status_code)
+        return None, error_status(response)
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
         data = response.json()
-        if data:
-            return data[0]["Key"]
-        else:
-            print("Город не найден.")
-            return None
+    except ValueError:
+        return None, response.status_code
+    if not data:
+        return None, response.status_code
+
+    location = _parse_location(data)
+    spatial_index.add(location)
+    spatial_index.add(location, latitude, longitude)
+    location_cache.set(("geoposition", spatial_index.cell(latitude, longitude)), location)
+    return location, response.status_code
+
+
+def _cache_ttl(headers, default=FORECAST_CACHE_TTL):
+    # Cache-Control: max-age важнее Expires, как и в HTTP-кэшах
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            return int(value)
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return (parsedate_to_datetime(expires) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            pass
+    return default
+
+
+def fetch_daily_forecast(location_key, api_key=API_KEY, priority=INTERACTIVE):
+    """
+    Возвращает полный 5-дневный прогноз для локации, при возможности из кэша.
+
+    Все горизонты (3 и 5 дней) и все метрики получаются срезом этого ответа.
+
+    Returns:
+        tuple: (payload, status_code). payload — utls.records.Forecast с нужными
+        полями ответа forecasts/v1/daily/5day или None; status_code равен None, если до API не удалось достучаться.
+        Если известен только просроченный прогноз, а API недоступен, квоты не
+        хватает или обновление не успело за STALE_REFRESH_WAIT секунд,
+        возвращается он со статусом STALE_STATUS.
+    """
+    if priority == INTERACTIVE:
+        forecast_refresher.touch(location_key)
+    payload = forecast_cache.get(location_key)
+    if payload is not None:
+        CACHE_LOOKUPS.inc(cache="forecast", result="hit")
+        return payload, 200
+
+    flight_key = ("forecast", location_key)
+    stale = forecast_cache.get_stale(location_key)
+    if stale is None:
+        CACHE_LOOKUPS.inc(cache="forecast", result="miss")
+        return _flights.do(flight_key, _download_forecast, location_key, api_key, priority)
+
+    payload, status_code = _revalidate_forecast(location_key, api_key, priority)
+    if payload is None:
+        CACHE_LOOKUPS.inc(cache="forecast", result="stale")
+        return stale, STALE_STATUS
+    CACHE_LOOKUPS.inc(cache="forecast", result="miss")
+    return payload, status_code
+
+
+def _revalidate_forecast(location_key, api_key, priority):
+    # Обновляет просроченный прогноз; (None, None) — отдать старый
+    flight_key = ("forecast", location_key)
+    if quota_scheduler.is_low() or breaker.is_open() or _flights.in_flight(flight_key):
+        return None, None
+
+    # Обновление продолжается в фоне, даже если мы перестали его ждать
+    future = _refresh_executor.submit(_flights.do, flight_key, _download_forecast, location_key, api_key, priority)
+    try:
+        return future.result(timeout=STALE_REFRESH_WAIT)
+    except FutureTimeoutError:
+        return None, None
+
+
+def conditional_headers(forecast):
+    """Заголовки условного запроса по валидаторам прошлого ответа: без изменений API ответит 304 без тела."""
+    headers = {}
+    if forecast is not None:
+        if forecast.etag:
+            headers["If-None-Match"] = forecast.etag
+        if forecast.last_modified:
+            headers["If-Modified-Since"] = forecast.last_modified
+    return headers
+
+
+def _download_forecast(location_key, api_key, priority):
+    params = {
+        "apikey": api_key,
+        "details": "true",
+        "metric": "true"}
+    previous = forecast_cache.get_stale(location_key)
+    try:
+        response = accuweather_get(FORECAST_5DAY_URL + str(location_key), params, priority,
+                                   conditional_headers(previous))
+    except QuotaExceeded:
+        logger.warning("Ошибка при получении прогноза погоды: исчерпана квота API")
+        return None, QUOTA_EXCEEDED_STATUS
+    except CircuitOpen:
+        logger.warning("Ошибка при получении прогноза погоды: API недоступен")
+        return None, None
     except requests.exceptions.RequestException as e:
-        print(f"Ошибка при поиске города: {e}")
-        return None
\ No newline at end of file
+        logger.warning("Ошибка при получении прогноза погоды: %s", e)
+        return None, None
+
+    if response.status_code == NOT_MODIFIED_STATUS and previous is not None:
+        # Прогноз не изменился: продлеваем старый, тело не скачивалось
+        forecast = previous.with_validators(response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    elif response.status_code != 200:
+        logger.warning("fetch_daily_forecast: статус %s", response.status_code)
+        return None, error_status(response)
+    else:
+        try:
+            forecast = Forecast.from_payload(response.json(), response.headers.get("ETag"),
+                                             response.headers.get("Last-Modified"))
+        except (ValueError, KeyError, TypeError):
+            logger.warning("fetch_daily_forecast: не удалось разобрать ответ для %s", location_key)
+            return None, response.status_code
+
+    forecast_archive.record(location_key, forecast)
+    ttl = _cache_ttl(response.headers)
+    if ttl > 0:
+        forecast_cache.set(location_key, forecast, ttl)
+    return forecast, 200
+
+
+def refresh_forecast(location_key, api_key=API_KEY):
+    """Запрашивает прогноз заново, даже если в кэше есть свежий."""
+    return _flights.do(("forecast", location_key), _download_forecast, location_key, api_key, BACKGROUND)
+
+
+def start_forecast_refresher(api_key=API_KEY):
+    """Запускает фоновое обновление популярных прогнозов в этом процессе."""
+    forecast_refresher.start(lambda location_key: refresh_forecast(location_key, api_key))
+
+
+def _prefetch_forecast(location_key, api_key):
+    fetch_daily_forecast(location_key, api_key, BACKGROUND)
+
+
+def resolve_route(cities, api_key=API_KEY, prefetch_forecasts=False, timeout=ROUTE_TIMEOUT):
+    """
+    Параллельно находит все точки маршрута.
+
+    Args:
+        cities (list): Названия городов в порядке маршрута.
+        api_key (str): Ключ AccuWeather.
+        prefetch_forecasts (bool): Сразу запросить прогнозы найденных точек в фоне,
+            чтобы последующие вызовы брали их из кэша.
+        timeout (float): Сколько ждать самую медленную точку, в секундах.
+
+    Returns:
+        list: Локации в том же порядке, что и cities; None для городов, которые
+        не найдены, завершились ошибкой или не успели за timeout.
+    """
+    futures = {}
+    for city in cities:
+        cache_key = _normalize_city(city) if city else ""
+        if cache_key not in futures:
+            futures[cache_key] = _route_executor.submit(resolve_location, city, api_key)
+
+    wait(futures.values(), timeout=timeout)
+
+    locations = []
+    for city in cities:
+        future = futures[_normalize_city(city) if city else ""]
+        location = None
+        if future.done() and future.exception() is None:
+            location = future.result()[0]
+        elif not future.done():
+            logger.warning("resolve_route: истёк таймаут для %s", city)
+        locations.append(location)
+
+    if prefetch_forecasts:
+        for key in {location['key'] for location in locations if location}:
+            _route_executor.submit(_prefetch_forecast, key, api_key)
+    return locations
+
+
+def _city_forecast(city, api_key):
+    location, status_code = resolve_location(city, api_key)
+    if location is None:
+        return None, None, status_code
+    payload, status_code = fetch_daily_forecast(location['key'], api_key)
+    return location, payload, status_code
+
+
+def iter_city_forecasts(cities, api_key=API_KEY, concurrency=CITY_BATCH_CONCURRENCY):
+    """
+    Находит города и их прогнозы параллельно и выдаёт результаты по мере готовности.
+
+    Одинаковые названия (с точностью до регистра и пробелов) запрашиваются один раз.
+    В пуле маршрутов одновременно не больше concurrency городов (по умолчанию
+    половина пула), так что большой список не держит в памяти все ответы сразу,
+    а одиночные маршруты, поставленные в пул в это время, не ждут весь список.
+
+    Yields:
+        tuple: (city_key, location, payload, status_code), где city_key —
+        нормализованное название; payload None, если прогноз получить не удалось.
+    """
+    queue = iter(dict.fromkeys(_normalize_city(city) for city in cities if city and city.strip()))
+    pending = {}
+
+    def submit_next():
+        city_key = next(queue, None)
+        if city_key is not None:
+            pending[_route_executor.submit(_city_forecast, city_key, api_key)] = city_key
+
+    for _ in range(concurrency):
+        submit_next()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            city_key = pending.pop(future)
+            submit_next()
+            try:
+                location, payload, status_code = future.result()
+            except Exception:
+                logger.exception("iter_city_forecasts: ошибка для %s", city_key)
+                location, payload, status_code = None, None, None
+            yield city_key, location, payload, status_code
+
+
+def nearest_known_city(latitude, longitude, max_km):
+    """Ближайший город справочника с известным ключом AccuWeather не дальше max_km или None."""
+    # Грубый отбор по широте, чтобы не считать расстояние до каждого города
+    max_degrees = max_km / 111
+    best, best_distance = None, max_km
+    for entry in gazetteer.entries():
+        if not entry['key'] or abs(entry['latitude'] - latitude) > max_degrees:
+            continue
+        distance = haversine_km(latitude, longitude, entry['latitude'], entry['longitude'])
+        if distance <= best_distance:
+            best, best_distance = entry, distance
+    return best
+
+
+def _sample_forecast(latitude, longitude, api_key, snap_km):
+    # Точка по пути привязывается к известному городу рядом (без поиска по координатам)
+    location = nearest_known_city(latitude, longitude, snap_km)
+    if location is None:
+        location, _ = resolve_coordinates(latitude, longitude, api_key, priority=BACKGROUND)
+    if location is None:
+        return None, None
+    payload, _ = fetch_daily_forecast(location['key'], api_key, BACKGROUND)
+    return location, payload
+
+
+def sample_route_forecasts(locations, api_key=API_KEY, step_km=ROUTE_SAMPLE_STEP_KM,
+                           max_samples=ROUTE_MAX_SAMPLES, timeout=ROUTE_TIMEOUT):
+    """
+    Прогнозы в промежуточных точках вдоль маршрута.
+
+    Маршрут сэмплируется по дугам большого круга через каждые step_km, из точек
+    в одной ячейке geohash остаётся одна, и прогноз запрашивается только для
+    различных ячеек (кроме ячеек самих путевых точек), не больше max_samples.
+
+    Args:
+        locations (list): Найденные путевые точки; None пропускаются.
+
+    Returns:
+        tuple: (path, samples). path — список (широта, долгота) для отрисовки
+        маршрута; samples — словари latitude, longitude, location, forecast для
+        точек, по которым удалось получить прогноз.
+    """
+    path, cells = _route_sample_cells(locations, step_km, max_samples)
+    samples = dict(_iter_samples(cells, api_key, timeout, step_km / 2))
+    return path, [samples[index] for index in sorted(samples)]
+
+
+def iter_route_samples(locations, api_key=API_KEY, step_km=ROUTE_SAMPLE_STEP_KM,
+                       max_samples=ROUTE_MAX_SAMPLES, timeout=ROUTE_TIMEOUT):
+    """
+    То же, что sample_route_forecasts, но точки выдаются по мере готовности прогнозов.
+
+    Yields:
+        tuple: (index, sample) — номер точки вдоль маршрута и словарь latitude,
+        longitude, location, forecast.
+    """
+    _, cells = _route_sample_cells(locations, step_km, max_samples)
+    yield from _iter_samples(cells, api_key, timeout, step_km / 2)
+
+
+def _route_sample_cells(locations, step_km, max_samples):
+    points = [(location['latitude'], location['longitude']) for location in locations if location]
+    if len(points) < 2:
+        return points, []
+
+    # Ячейки размером с шаг: иначе каждая точка попадает в свою ячейку и ничего не объединяется
+    precision = precision_for_km(step_km)
+    path, cells = sample_route_cells(points, step_km, precision)
+    if quota_scheduler.is_low():
+        # Точки по пути — не главное; остаток квоты оставляем пользователям
+        return [tuple(point) for point in path.tolist()], []
+    waypoint_cells = {geohash_encode(latitude, longitude, precision) for latitude, longitude in points}
+    cells = [cell for cell in cells if cell['cell'] not in waypoint_cells]
+    if len(cells) > max_samples:
+        # Равномерно прореживаем, чтобы покрыть весь маршрут
+        step = len(cells) / max_samples
+        cells = [cells[int(i * step)] for i in range(max_samples)]
+    return [tuple(point) for point in path.tolist()], cells
+
+
+def _iter_samples(cells, api_key, timeout, snap_km):
+    futures = {
+        _route_executor.submit(_sample_forecast, cell['latitude'], cell['longitude'], api_key, snap_km): index
+        for index, cell in enumerate(cells)
+    }
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            if future.exception() is not None:
+                continue
+            location, payload = future.result()
+            if payload is not None:
+                cell = cells[futures[future]]
+                yield futures[future], {
+                    'latitude': cell['latitude'],
+                    'longitude': cell['longitude'],
+                    'location': location,
+                    'forecast': payload,
+                }
+    except FutureTimeoutError:
+        # Точки, не успевшие к timeout, пропускаются; их прогнозы всё равно попадут в кэш
+        pass
+
+
+def get_weather_data(city, days):
+    location_key = get_location_key(city,  API_KEY)
+    if not location_key or location_key in ("connection_error", "quota_exceeded"):
+        return None
+    payload, status_code = fetch_daily_forecast(location_key, API_KEY)
+    if payload is None:
+        return None
+
+    table = decode_forecasts({city: payload})
+    table = table[table["day"] < days].reset_index(drop=True)
+    table.attrs["stale"] = status_code == STALE_STATUS
+    return table
+
+
+def forecast_version(city):
+    """
+    Версия прогноза города для ETag: отпечаток содержимого и признак устаревших данных.
+
+    Returns:
+        tuple | None: (digest, stale) или None, если прогноз получить не удалось.
+    """
+    location_key = get_location_key(city, API_KEY)
+    if not location_key or location_key in ("connection_error", "quota_exceeded"):
+        return None
+    forecast, status_code = fetch_daily_forecast(location_key, API_KEY)
+    if forecast is None:
+        return None
+    return forecast.digest(), status_code == STALE_STATUS
+
+
+def get_city_coordinates(city_name):
+    # Координаты из справочника известны и без ключа AccuWeather
+    entry = gazetteer.lookup(city_name) if city_name else None
+    if entry is not None:
+        return (entry["latitude"], entry["longitude"])
+
+    location, _ = resolve_location(city_name, API_KEY)
+    if location is None:
+        return None
+
+    return (location["latitude"], location["longitude"])
+
+
+def get_location_key(location, api_key):
+    location_data, status_code = resolve_location(location, api_key)
+    if location_data is None:
+        if status_code in QUOTA_EXCEEDED_CODES:
+            return "quota_exceeded"
+        if status_code is None or status_code in CONNECTION_ERROR_CODES:
+            return "connection_error"
+        return None
+    return location_data["key"]
@@ -0,0 +1,393 @@
+"""
+Метрики приложения и бота в текстовом формате Prometheus.
+
+Все метрики процесса живут в одном реестре REGISTRY и отдаются на /metrics:
+веб-приложению маршрут добавляет init_flask_metrics, бот поднимает отдельный
+HTTP-сервер через start_metrics_server. Воркеры gunicorn (CACHE_BACKEND=sqlite)
+сводят свои реестры через общую базу, см. SharedMetrics.
+"""
+import atexit
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from utls.cache import CACHE_BACKEND, SHARED_CACHE_PATH, shared_db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Сервер метрик бота; по умолчанию доступен только локально, пустой METRICS_PORT отключает его
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100") or 0) or None
+# Как часто процесс веб-приложения записывает свои метрики в общую базу
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", 5))
+
+# Границы корзин гистограмм по умолчанию, в секундах (как у клиентов Prometheus)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def rows(self):
+        """Строки метрики: (имя, метки в формате Prometheus, значение)."""
+        return [(name, _format_labels(self.labelnames, key, extra), value) for name, key, extra, value in self._samples()]
+
+    def render(self, rows=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.rows() if rows is None else rows:
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение; если задана функция (set_function), оно вычисляется при каждом сборе.
+
+    multiprocess — как сводить значения процессов в SharedMetrics: sum, max или min.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess="sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess = multiprocess
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            return [(self.name, (), (), self._function())]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative))
+                samples.append((f"{self.name}_sum", key, (), total))
+                samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def rows(self):
+        """Строки всех метрик: (метрика, имя, метки, значение)."""
+        return [(metric.name, *row) for metric in self._metrics.values() for row in metric.rows()]
+
+    def render(self, rows=None):
+        """Текст для /metrics; rows — строки по именам метрик вместо собственных значений."""
+        return "\n".join(metric.render(None if rows is None else rows.get(metric.name, []))
+                         for metric in self._metrics.values()) + "\n"
+
+
+class SharedMetrics:
+    """
+    Метрики всех процессов веб-приложения в общей базе SQLite (CACHE_BACKEND=sqlite).
+
+    У каждого воркера gunicorn свой реестр, а на /metrics отвечает тот, кому
+    достался запрос. Поэтому каждый процесс раз в interval секунд и перед ответом
+    на /metrics записывает свои строки в таблицу metrics, а /metrics отдаёт их
+    сумму по процессам. Счётчики и гистограммы завершившихся процессов остаются
+    в сумме, чтобы итоги не уменьшались; датчики берутся только у процессов,
+    писавших недавно, и сводятся по Gauge.multiprocess.
+    """
+
+    def __init__(self, registry, path=SHARED_CACHE_PATH, interval=METRICS_PUBLISH_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._local = threading.local()
+        self._pid = None
+        self._process = None
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS metrics (process TEXT NOT NULL, metric TEXT NOT NULL, sample TEXT NOT NULL, "
+            "labels TEXT NOT NULL, value REAL NOT NULL, seq INTEGER NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (process, sample, labels))"
+        )
+
+    def _db(self):
+        return shared_db(self._local, self.path)
+
+    def _process_id(self):
+        # pid может достаться новому процессу, поэтому к нему добавляется случайная часть
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._process = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        return self._process
+
+    def publish(self):
+        """Записывает текущие значения процесса в общую базу."""
+        process, now = self._process_id(), time.time()
+        rows = [(process, metric, sample, labels, value, seq, now)
+                for seq, (metric, sample, labels, value) in enumerate(self.registry.rows())]
+        try:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning("Не удалось записать метрики в общую базу: %s", e)
+
+    def render(self):
+        """Текст для /metrics со сводными значениями всех процессов."""
+        self.publish()
+        try:
+            stored = self._db().execute(
+                "SELECT metric, sample, labels, value, updated FROM metrics ORDER BY process, seq").fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Не удалось прочитать метрики из общей базы: %s", e)
+            return self.registry.render()
+        alive_since = time.time() - 3 * self.interval
+        values = {}
+        for metric, sample, labels, value, updated in stored:
+            if isinstance(self.registry.get(metric), Gauge) and updated < alive_since:
+                continue
+            values.setdefault(metric, {}).setdefault((sample, labels), []).append(value)
+        rows = {}
+        for metric, series in values.items():
+            combine = {"sum": sum, "max": max, "min": min}[getattr(self.registry.get(metric), "multiprocess", "sum")]
+            rows[metric] = [(sample, labels, combine(parts)) for (sample, labels), parts in series.items()]
+        return self.registry.render(rows)
+
+    def start(self):
+        """Фоновая запись метрик процесса; последняя запись — при завершении."""
+        threading.Thread(target=self._run, name="metrics-publish", daemon=True).start()
+        atexit.register(self.publish)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.publish()
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Запросы к AccuWeather
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    "weather_upstream_requests_total", "Запросы к AccuWeather по эндпоинту и статусу ответа",
+    ("endpoint", "status")))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram(
+    "weather_upstream_request_seconds", "Время запроса к AccuWeather", ("endpoint",)))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "weather_upstream_in_flight", "Запросы к AccuWeather, ожидающие ответа"))
+
+# Кэши: hit — свежая запись, stale — отдана просроченная, miss — пришлось идти в API
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "weather_cache_lookups_total", "Обращения к кэшам по результату", ("cache", "result")))
+
+# Квота и предохранитель
+QUOTA_REMAINING = REGISTRY.register(Gauge(
+    "weather_quota_remaining", "Остаток дневной квоты AccuWeather", multiprocess="min"))
+QUOTA_DENIED = REGISTRY.register(Counter(
+    "weather_quota_denied_total", "Запросы, не пропущенные планировщиком квоты", ("priority",)))
+BREAKER_OPEN = REGISTRY.register(Gauge(
+    "weather_breaker_open", "1, если цепь к AccuWeather разомкнута", multiprocess="max"))
+
+# Веб-приложение, Dash и бот
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "weather_http_requests_total", "Запросы к веб-приложению", ("endpoint", "method", "status")))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "weather_http_request_seconds", "Время обработки запроса веб-приложением", ("endpoint",)))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "weather_http_in_flight", "Запросы, которые веб-приложение обрабатывает сейчас"))
+DASH_CALLBACK_SECONDS = REGISTRY.register(Histogram(
+    "weather_dash_callback_seconds", "Время серверных колбэков Dash", ("callback",)))
+BOT_HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "weather_bot_handler_seconds", "Время обработчиков бота", ("handler",)))
+BOT_HANDLERS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "weather_bot_handlers_in_flight", "Обработчики бота, выполняющиеся сейчас"))
+
+
+def timed(histogram, **labels):
+    """Декоратор: время каждого вызова функции в histogram."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_flask_metrics(app):
+    """
+    Замеряет все запросы к приложению Flask и добавляет маршрут /metrics.
+
+    При CACHE_BACKEND=sqlite /metrics отдаёт сумму по всем процессам (SharedMetrics).
+    """
+    from flask import Response, g, request
+
+    shared = SharedMetrics(REGISTRY) if CACHE_BACKEND == "sqlite" else None
+    if shared is not None:
+        shared.start()
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_request(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        HTTP_IN_FLIGHT.dec()
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=g.pop("metrics_status", 500))
+
+    @app.route("/metrics")
+    def metrics():
+        body = shared.render() if shared is not None else REGISTRY.render()
+        return Response(body, mimetype=CONTENT_TYPE)
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    HTTP-сервер с /metrics для процессов без Flask (бот).
+
+    Returns:
+        aiohttp.web.AppRunner | None: runner.cleanup() останавливает сервер; None, если порт не задан.
+    """
+    if port is None:
+        return None
+    from aiohttp import web
+
+    async def metrics(_):
+        return web.Response(body=REGISTRY.render().encode("utf-8"),
+                            headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    return runner
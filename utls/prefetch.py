@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from utls.cache import CACHE_BACKEND, SHARED_CACHE_PATH, shared_db
+from utls.quota import DAILY_QUOTA, QUOTA_EXCEEDED_STATUS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых популярных прогнозов обновлять заранее
+REFRESH_TOP_N = int(os.getenv("REFRESH_TOP_N", 20))
+# За сколько секунд до истечения срока жизни обновлять прогноз
+REFRESH_AHEAD_WINDOW = float(os.getenv("REFRESH_AHEAD_WINDOW", 120))
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", 30))
+# Популярность уменьшается вдвое за это время, чтобы вчерашние маршруты не тратили квоту
+REFRESH_HALF_LIFE = float(os.getenv("REFRESH_HALF_LIFE", 60 * 60))
+# Ключи с меньшим числом обращений не обновляются: разовые запросы не окупают квоту
+REFRESH_MIN_HITS = float(os.getenv("REFRESH_MIN_HITS", 2))
+# Доля дневной квоты, которую может потратить фоновое обновление
+REFRESH_QUOTA_SHARE = float(os.getenv("REFRESH_QUOTA_SHARE", 0.2))
+# На сколько секунд процесс занимает ключ перед обновлением (CACHE_BACKEND=sqlite)
+REFRESH_LEASE = float(os.getenv("REFRESH_LEASE", REFRESH_INTERVAL))
+
+
+class RefreshBudget:
+    """Дневной лимит фоновых обновлений одного процесса (UTC)."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._day = None
+        self._spent = 0
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        # Обновлением занят один поток процесса — делить ключи не с кем
+        return True
+
+    def try_spend(self):
+        with self._lock:
+            today = datetime.now(timezone.utc).date()
+            if today != self._day:
+                self._day, self._spent = today, 0
+            if self._spent >= self.limit:
+                return False
+            self._spent += 1
+            return True
+
+    def refund(self, count=1):
+        with self._lock:
+            self._spent = max(0, self._spent - count)
+
+
+class SharedRefreshBudget:
+    """
+    Лимит фоновых обновлений и аренда ключей в общей базе SQLite — одни на все процессы.
+
+    Как и SharedDailyBudget, воркеры gunicorn и бот списывают обновления атомарным
+    UPDATE ... WHERE used < limit и вместе не превысят limit. Перед обновлением
+    ключ занимается на lease секунд условным UPDATE: один и тот же прогноз
+    обновляет только один процесс. Ошибки базы не останавливают обновление.
+    """
+
+    def __init__(self, limit, path=SHARED_CACHE_PATH, lease=REFRESH_LEASE):
+        self.limit = limit
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS refresh_quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS refresh_leases (key TEXT PRIMARY KEY, until REAL NOT NULL)")
+
+    def _db(self):
+        return shared_db(self._local, self.path)
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def claim(self, key):
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute("INSERT OR IGNORE INTO refresh_leases (key, until) VALUES (?, 0)", (key,))
+            return bool(db.execute("UPDATE refresh_leases SET until = ? WHERE key = ? AND until <= ?",
+                                   (now + self.lease, key, now)).rowcount)
+        except sqlite3.Error as e:
+            logger.warning("Не удалось занять ключ для обновления: %s", e)
+            return True
+
+    def try_spend(self):
+        day = self._today()
+        try:
+            db = self._db()
+            db.execute("INSERT OR IGNORE INTO refresh_quota (day, used) VALUES (?, 0)", (day,))
+            return bool(db.execute("UPDATE refresh_quota SET used = used + 1 WHERE day = ? AND used < ?",
+                                   (day, self.limit)).rowcount)
+        except sqlite3.Error as e:
+            logger.warning("Не удалось списать обновление: %s", e)
+            return True
+
+    def refund(self, count=1):
+        try:
+            self._db().execute("UPDATE refresh_quota SET used = MAX(0, used - ?) WHERE day = ?",
+                               (count, self._today()))
+        except sqlite3.Error as e:
+            logger.warning("Не удалось вернуть обновление: %s", e)
+
+
+def make_refresh_budget(limit):
+    """Лимит фоновых обновлений: общий для процессов при CACHE_BACKEND=sqlite, иначе свой у процесса."""
+    if CACHE_BACKEND == "sqlite":
+        return SharedRefreshBudget(limit)
+    return RefreshBudget(limit)
+
+
+class RefreshAhead:
+    """
+    Заранее обновляет самые запрашиваемые записи кэша, пока они не истекли.
+
+    Пользовательские запросы отмечаются через touch; раз в REFRESH_INTERVAL
+    секунд из top_n самых популярных ключей выбираются те, чьи записи истекают
+    в ближайшие window секунд, и для них вызывается функция обновления.
+
+    Args:
+        cache (TTLCache): Кэш, сроки жизни записей которого отслеживаются.
+        top_n (int): Сколько популярных ключей рассматривать.
+        window (float): За сколько секунд до истечения обновлять запись.
+        daily_limit (int): Сколько обновлений можно сделать за сутки (UTC), см. make_refresh_budget.
+    """
+
+    def __init__(self, cache, top_n=REFRESH_TOP_N, window=REFRESH_AHEAD_WINDOW,
+                 daily_limit=int(DAILY_QUOTA * REFRESH_QUOTA_SHARE),
+                 half_life=REFRESH_HALF_LIFE, min_hits=REFRESH_MIN_HITS):
+        self.cache = cache
+        self.top_n = top_n
+        self.window = window
+        self.budget = make_refresh_budget(daily_limit)
+        self.half_life = half_life
+        self.min_hits = min_hits
+        self._hits = {}
+        self._decayed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def touch(self, key):
+        with self._lock:
+            self._hits[key] = self._hits.get(key, 0) + 1
+
+    def _decay(self):
+        # Раз в half_life секунд счётчики делятся пополам, единичные обращения забываются
+        now = time.monotonic()
+        while now - self._decayed_at >= self.half_life:
+            self._decayed_at += self.half_life
+            self._hits = {key: hits / 2 for key, hits in self._hits.items() if hits >= 2}
+
+    def due(self):
+        """Популярные ключи, записи которых скоро истекут, в порядке убывания популярности."""
+        with self._lock:
+            self._decay()
+            popular = sorted(self._hits.items(), key=lambda item: -item[1])[:self.top_n]
+        result = []
+        for key, hits in popular:
+            if hits < self.min_hits:
+                break
+            expires_in = self.cache.expires_in(key)
+            # Вытесненные записи не восстанавливаем: раз их вытеснили, они не так популярны
+            if expires_in is not None and expires_in < self.window:
+                result.append(key)
+        return result
+
+    def _claim_due(self):
+        """Подошедшие ключи, занятые этим процессом; обновление каждого уже списано с лимита."""
+        claimed = []
+        for key in self.due():
+            if not self.budget.claim(key):
+                continue
+            if not self.budget.try_spend():
+                break
+            claimed.append(key)
+        return claimed
+
+    def refresh_once(self, fetch):
+        """
+        Обновляет подошедшие записи вызовом fetch(key) -> (payload, status_code).
+
+        Returns:
+            int: Сколько записей обновлено.
+        """
+        refreshed = 0
+        keys = self._claim_due()
+        for index, key in enumerate(keys):
+            _, status_code = fetch(key)
+            if status_code == QUOTA_EXCEEDED_STATUS:
+                # Планировщик квоты не пустил запрос — квота не потрачена, пробуем в следующий раз
+                self.budget.refund(len(keys) - index)
+                break
+            if status_code == 200:
+                refreshed += 1
+        return refreshed
+
+    def start(self, fetch, interval=REFRESH_INTERVAL):
+        """Запускает обновление в фоновом потоке (для Flask); повторный вызов ничего не делает."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(fetch, interval),
+                                            name="refresh-ahead", daemon=True)
+        self._thread.start()
+
+    def _run(self, fetch, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh_once(fetch)
+            except Exception:
+                logger.exception("Ошибка фонового обновления прогнозов")
+
+    async def run_async(self, fetch, interval=REFRESH_INTERVAL):
+        """То же для цикла событий бота; fetch — корутина."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Кэш, лимит и аренда ключей могут быть в SQLite — не на цикле событий
+                loop = asyncio.get_running_loop()
+                keys = await loop.run_in_executor(None, self._claim_due)
+                for index, key in enumerate(keys):
+                    _, status_code = await fetch(key)
+                    if status_code == QUOTA_EXCEEDED_STATUS:
+                        await loop.run_in_executor(None, self.budget.refund, len(keys) - index)
+                        break
+            except Exception:
+                logger.exception("Ошибка фонового обновления прогнозов")
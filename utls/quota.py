@@ -0,0 +1,299 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from utls.cache import CACHE_BACKEND, SHARED_CACHE_PATH, shared_db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: запросы пользователей обслуживаются раньше фоновых
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Статус, которым локальный планировщик сообщает об отказе из-за квоты
+QUOTA_EXCEEDED_STATUS = 429
+# Статусы отказа из-за квоты. AccuWeather отвечает на исчерпанный лимит 503, но 503
+# бывает и при перегрузке: клиенты (utls.main, utls.async_client) заменяют 503 с
+# сообщением о квоте на QUOTA_EXCEEDED_STATUS, а прочие 503 — временный сбой
+QUOTA_EXCEEDED_CODES = (QUOTA_EXCEEDED_STATUS,)
+QUOTA_EXCEEDED_MESSAGE = "the allowed number of requests has been exceeded"
+
+DAILY_QUOTA = int(os.getenv("DAILY_QUOTA", 50))
+QUOTA_RATE = float(os.getenv("QUOTA_RATE", 5))
+QUOTA_BURST = float(os.getenv("QUOTA_BURST", 10))
+QUOTA_MAX_WAIT = float(os.getenv("QUOTA_MAX_WAIT", 2))
+# Доля дневной квоты, которую фоновые запросы не трогают
+QUOTA_BACKGROUND_RESERVE = float(os.getenv("QUOTA_BACKGROUND_RESERVE", 0.2))
+# Когда остаток квоты ниже этой доли, отдаём устаревшие данные из кэша вместо запроса
+QUOTA_LOW_WATERMARK = float(os.getenv("QUOTA_LOW_WATERMARK", 0.1))
+QUOTA_STATE_FILE = os.getenv("QUOTA_STATE_FILE", "quota_state.json")
+# Счётчик квоты пишется в файл не чаще раза в столько секунд, а не на каждый запрос
+QUOTA_SAVE_INTERVAL = float(os.getenv("QUOTA_SAVE_INTERVAL", 5))
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate токенов в секунду, не больше capacity про запас.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, reserve=0):
+        """
+        Берёт токен, если после этого в ведре останется не меньше reserve.
+
+        Returns:
+            float: 0, если токен взят, иначе сколько секунд ждать следующей попытки.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1 + reserve:
+                self._tokens -= 1
+                return 0.0
+            return (1 + reserve - self._tokens) / self.rate
+
+
+class DailyBudget:
+    """
+    Счётчик запросов за текущие сутки (UTC), сохраняемый в файл между перезапусками.
+
+    Файл переписывается не чаще раза в save_interval секунд; flush сохраняет
+    несохранённое (вызывается и при выходе).
+    """
+
+    def __init__(self, limit, path, save_interval=QUOTA_SAVE_INTERVAL):
+        self.limit = limit
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._day, self.used = self._load()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("date") == self._today():
+                return state["date"], int(state["used"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return self._today(), 0
+
+    def _save(self):
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"date": self._day, "used": self.used}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить счётчик квоты: %s", e)
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._day:
+            self._day, self.used = today, 0
+
+    def remaining(self):
+        with self._lock:
+            self._roll_over()
+            return max(0, self.limit - self.used)
+
+    def try_spend(self, reserve=0):
+        with self._lock:
+            self._roll_over()
+            if self.limit - self.used <= reserve:
+                return False
+            self.used += 1
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+            return True
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def exhaust(self):
+        with self._lock:
+            self._roll_over()
+            self.used = max(self.used, self.limit)
+            self._save()
+
+
+class SharedDailyBudget:
+    """
+    Тот же счётчик в общей базе SQLite (CACHE_BACKEND=sqlite) — один на все процессы.
+
+    Воркеры gunicorn и бот тратят одну дневную квоту: списание — атомарный
+    UPDATE ... WHERE used < limit, так что вместе процессы не превысят limit.
+    remaining() для решений «квоты мало» берёт значение не старше refresh секунд.
+    Ошибки базы не блокируют запросы: списание разрешается, как без счётчика.
+    """
+
+    def __init__(self, limit, path=SHARED_CACHE_PATH, refresh=1.0):
+        self.limit = limit
+        self.path = path
+        self.refresh = refresh
+        self._local = threading.local()
+        self._used = 0
+        self._read_at = None
+        self._db().execute("CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+
+    def _db(self):
+        return shared_db(self._local, self.path)
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def _read(self):
+        try:
+            row = self._db().execute("SELECT used FROM quota WHERE day = ?", (self._today(),)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Не удалось прочитать счётчик квоты: %s", e)
+            return self._used
+        self._used, self._read_at = (row[0] if row else 0), time.monotonic()
+        return self._used
+
+    def remaining(self):
+        if self._read_at is None or time.monotonic() - self._read_at >= self.refresh:
+            self._read()
+        return max(0, self.limit - self._used)
+
+    def try_spend(self, reserve=0):
+        day = self._today()
+        try:
+            db = self._db()
+            db.execute("INSERT OR IGNORE INTO quota (day, used) VALUES (?, 0)", (day,))
+            spent = db.execute("UPDATE quota SET used = used + 1 WHERE day = ? AND used < ?",
+                               (day, self.limit - reserve)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("Не удалось списать квоту: %s", e)
+            return True
+        if spent:
+            self._used += 1
+        else:
+            # Квоты не осталось — пусть remaining() сразу это увидит
+            self._read_at = None
+        return bool(spent)
+
+    def exhaust(self):
+        day = self._today()
+        try:
+            db = self._db()
+            db.execute("INSERT OR IGNORE INTO quota (day, used) VALUES (?, 0)", (day,))
+            db.execute("UPDATE quota SET used = MAX(used, ?) WHERE day = ?", (self.limit, day))
+        except sqlite3.Error as e:
+            logger.warning("Не удалось сохранить счётчик квоты: %s", e)
+        self._used = max(self._used, self.limit)
+
+    def flush(self):
+        pass
+
+
+def make_budget(limit=DAILY_QUOTA):
+    """Дневной бюджет: общий для процессов при CACHE_BACKEND=sqlite, иначе в файле QUOTA_STATE_FILE."""
+    if CACHE_BACKEND == "sqlite":
+        return SharedDailyBudget(limit)
+    return DailyBudget(limit, QUOTA_STATE_FILE)
+
+
+class QuotaScheduler:
+    """
+    Пропускает запросы к AccuWeather через ограничитель частоты и дневной бюджет.
+
+    Запросы пользователей (INTERACTIVE) могут немного подождать токена и
+    используют весь бюджет. Фоновые (BACKGROUND) не ждут, оставляют половину
+    ведра и долю дневного бюджета для пользователей.
+    """
+
+    def __init__(self, bucket, budget, background_reserve=QUOTA_BACKGROUND_RESERVE,
+                 low_watermark=QUOTA_LOW_WATERMARK):
+        self.bucket = bucket
+        self.budget = budget
+        self.background_reserve = int(budget.limit * background_reserve)
+        self.low_watermark = int(budget.limit * low_watermark)
+
+    def is_low(self):
+        return self.budget.remaining() <= self.low_watermark
+
+    def _try_acquire(self, priority):
+        # Возвращает (granted, wait); wait None — ждать бессмысленно
+        background = priority == BACKGROUND
+        budget_reserve = self.background_reserve if background else 0
+        if self.budget.remaining() <= budget_reserve:
+            return False, None
+        wait = self.bucket.take(reserve=self.bucket.capacity / 2 if background else 0)
+        if wait:
+            return False, None if background else wait
+        return self.budget.try_spend(budget_reserve), None
+
+    def acquire(self, priority=INTERACTIVE, max_wait=QUOTA_MAX_WAIT):
+        deadline = time.monotonic() + max_wait
+        while True:
+            granted, wait = self._try_acquire(priority)
+            if granted:
+                return True
+            if wait is None or time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, priority=INTERACTIVE, max_wait=QUOTA_MAX_WAIT):
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + max_wait
+        while True:
+            # Бюджет может писать на диск — не в цикле событий
+            granted, wait = await loop.run_in_executor(None, self._try_acquire, priority)
+            if granted:
+                return True
+            if wait is None or time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def record(self, status_code, body=""):
+        """
+        Учитывает ответ AccuWeather; body — текст ответа (нужен только для 503).
+
+        Бюджет считается исчерпанным до конца суток, только если ответ говорит
+        о квоте. Прочие 503 — временный сбой, им занимается предохранитель.
+        """
+        if is_quota_response(status_code, body):
+            self.budget.exhaust()
+
+
+def is_quota_response(status_code, body):
+    """503 с сообщением AccuWeather об исчерпанном лимите запросов."""
+    return status_code == 503 and QUOTA_EXCEEDED_MESSAGE in (body or "").lower()
+
+
+scheduler = QuotaScheduler(TokenBucket(QUOTA_RATE, QUOTA_BURST), make_budget())
+atexit.register(scheduler.budget.flush)
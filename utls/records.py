@@ -0,0 +1,91 @@
+"""
+Компактные записи прогноза вместо сырых ответов AccuWeather.
+
+Ответ forecasts/v1/daily/5day с details=true — это десятки вложенных полей на
+каждый день, из которых приложение читает шесть. В кэше хранится Forecast:
+кортеж DailyForecast со __slots__ и только нужными полями.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date
+
+
+@dataclass(frozen=True, slots=True)
+class DailyForecast:
+    date: date
+    temperature_min: float
+    temperature: float
+    wind_speed: float
+    precipitation: float
+    has_precipitation: bool
+    link: str
+
+    @classmethod
+    def from_payload(cls, day):
+        """Разбирает один элемент DailyForecasts ответа API."""
+        return cls(
+            date=date.fromisoformat(day["Date"][:10]),
+            temperature_min=float(day["Temperature"]["Minimum"]["Value"]),
+            temperature=float(day["Temperature"]["Maximum"]["Value"]),
+            wind_speed=float(day["Day"]["Wind"]["Speed"]["Value"]),
+            precipitation=float(day["Day"].get("PrecipitationProbability", 0)),
+            has_precipitation=bool(day["Day"].get("HasPrecipitation", False)),
+            link=day.get("Link", ""),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Forecast:
+    """
+    Прогноз по дням для одной локации.
+
+    etag и last_modified — валидаторы ответа AccuWeather для условного запроса
+    при обновлении (If-None-Match / If-Modified-Since); в содержимое не входят.
+    """
+    days: tuple
+    etag: str = None
+    last_modified: str = None
+
+    @classmethod
+    def from_payload(cls, payload, etag=None, last_modified=None):
+        """
+        Raises:
+            KeyError, TypeError, ValueError: Ответ не похож на прогноз AccuWeather или в нём нет дней.
+        """
+        days = tuple(DailyForecast.from_payload(day) for day in payload["DailyForecasts"])
+        # Все потребители берут хотя бы сегодняшний день (days[0])
+        if not days:
+            raise ValueError("В прогнозе нет ни одного дня")
+        return cls(days, etag, last_modified)
+
+    def with_validators(self, etag, last_modified):
+        """Тот же прогноз с валидаторами нового ответа (после 304 Not Modified)."""
+        return Forecast(self.days, etag or self.etag, last_modified or self.last_modified)
+
+    def digest(self):
+        """Короткий отпечаток содержимого: одинаковые прогнозы в любом процессе дают одну строку."""
+        data = json.dumps(self._rows(), ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+    def _rows(self):
+        return [
+            [day.date.isoformat(), day.temperature_min, day.temperature, day.wind_speed,
+             day.precipitation, day.has_precipitation, day.link]
+            for day in self.days
+        ]
+
+    def to_json(self):
+        """Поля в виде списков — для кэша в SQLite (см. utls.cache.SharedTTLCache)."""
+        return {"days": self._rows(), "etag": self.etag, "last_modified": self.last_modified}
+
+    @classmethod
+    def from_json(cls, data):
+        days = tuple(DailyForecast(date.fromisoformat(row[0]), *row[1:]) for row in data["days"])
+        return cls(days, data.get("etag"), data.get("last_modified"))
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        return iter(self.days)
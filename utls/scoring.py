@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Пороги благоприятной погоды; единственное место, где они задаются
+THRESHOLDS = {
+    "temperature_min": float(os.getenv("WEATHER_TEMPERATURE_MIN", 0)),
+    "temperature_max": float(os.getenv("WEATHER_TEMPERATURE_MAX", 35)),
+    "wind_speed_max": float(os.getenv("WEATHER_WIND_SPEED_MAX", 50)),
+    "precipitation_max": float(os.getenv("WEATHER_PRECIPITATION_MAX", 70)),
+    "humidity_min": float(os.getenv("WEATHER_HUMIDITY_MIN", 30)),
+    "humidity_max": float(os.getenv("WEATHER_HUMIDITY_MAX", 60)),
+    "visibility_min": float(os.getenv("WEATHER_VISIBILITY_MIN", 10)),
+}
+
+# Коды причин; при нескольких нарушениях берётся первое в этом порядке
+GOOD = 0
+TEMPERATURE = 1
+WIND = 2
+PRECIPITATION = 3
+HUMIDITY = 4
+VISIBILITY = 5
+
+REASONS = {
+    GOOD: "Благоприятные условия",
+    TEMPERATURE: "Неблагоприятные условия - температура",
+    WIND: "Неблагоприятные условия - ветер",
+    PRECIPITATION: "Неблагоприятные условия - осадки",
+    HUMIDITY: "Неблагоприятные условия - влажность",
+    VISIBILITY: "Неблагоприятные условия - видимость",
+}
+
+
+def score_weather(temperature, wind_speed, precipitation=0, has_precipitation=False,
+                  humidity=None, visibility=None, thresholds=THRESHOLDS):
+    """
+    Оценивает погоду сразу во всех ячейках массивов одной формы (обычно дни × точки).
+
+    humidity и visibility проверяются, только если переданы.
+
+    Returns:
+        tuple: (good, reason) — булев массив и массив кодов причин той же формы.
+    """
+    temperature = np.asarray(temperature, dtype=float)
+    checks = [
+        (TEMPERATURE, (temperature < thresholds["temperature_min"]) | (temperature > thresholds["temperature_max"])),
+        (WIND, np.asarray(wind_speed, dtype=float) > thresholds["wind_speed_max"]),
+        (PRECIPITATION, (np.asarray(precipitation, dtype=float) > thresholds["precipitation_max"])
+         | np.asarray(has_precipitation, dtype=bool)),
+    ]
+    if humidity is not None:
+        humidity = np.asarray(humidity, dtype=float)
+        checks.append((HUMIDITY, (humidity < thresholds["humidity_min"]) | (humidity > thresholds["humidity_max"])))
+    if visibility is not None:
+        checks.append((VISIBILITY, np.asarray(visibility, dtype=float) < thresholds["visibility_min"]))
+
+    reason = np.zeros(temperature.shape, dtype=np.int8)
+    # Идём с конца, чтобы более приоритетная причина перезаписала остальные
+    for code, failed in reversed(checks):
+        reason[np.broadcast_to(failed, reason.shape)] = code
+    return reason == GOOD, reason
+
+
+def describe(reason):
+    """Текст оценки для кода причины (или массив текстов для массива кодов)."""
+    if np.ndim(reason) == 0:
+        return REASONS[int(reason)]
+    return np.vectorize(REASONS.get, otypes=[object])(reason)
+
+
+def segment_risk(good):
+    """
+    Риск на участках между соседними точками: доля неблагоприятных концов участка.
+
+    Args:
+        good: Массив дни × точки.
+
+    Returns:
+        numpy.ndarray: Массив дни × (точки - 1) со значениями 0, 0.5 или 1.
+    """
+    bad = ~np.asarray(good, dtype=bool)
+    return (bad[:, :-1].astype(float) + bad[:, 1:]) / 2
+
+
+def best_departure_day(good):
+    """Индекс дня с наименьшим числом неблагоприятных точек (при равенстве — самый ранний)."""
+    bad_counts = (~np.asarray(good, dtype=bool)).sum(axis=1)
+    return int(np.argmin(bad_counts)) if len(bad_counts) else None
+
+
+def score_table(table, days=None):
+    """
+    Оценивает таблицу прогнозов из utls.decoder.decode_forecasts.
+
+    Returns:
+        dict: dates и locations (подписи осей), good и reason (дни × локации,
+        локации в порядке появления в таблице), risk (дни × участки) и
+        best_day (индекс дня или None).
+    """
+    import pandas as pd
+
+    if days is not None:
+        table = table[table["day"] < days]
+    locations = pd.unique(table["location"])
+
+    def grid(column):
+        return table.pivot(index="day", columns="location", values=column).reindex(columns=locations).to_numpy()
+
+    good, reason = score_weather(grid("temperature"), grid("wind_speed"), grid("precipitation"),
+                                 grid("has_precipitation").astype(bool))
+    dates = pd.DatetimeIndex(table.drop_duplicates("day").sort_values("day")["date"])
+    return {
+        "dates": dates,
+        "locations": list(locations),
+        "good": good,
+        "reason": reason,
+        "risk": segment_risk(good) if len(locations) > 1 else np.empty((len(dates), 0)),
+        "best_day": best_departure_day(good),
+    }
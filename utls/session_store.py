@@ -0,0 +1,61 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROUTE_STORE_PATH = os.getenv("ROUTE_STORE_PATH", "routes.sqlite3")
+ROUTE_SESSION_TTL = int(os.getenv("ROUTE_SESSION_TTL", 7 * 24 * 60 * 60))
+ROUTE_COOKIE = "route_session"
+
+
+class RouteStore:
+    """
+    Маршруты пользователей по токену сессии в SQLite.
+
+    Файл базы общий для всех процессов (воркеров gunicorn), поэтому маршрут,
+    сохранённый одним воркером, виден остальным.
+    """
+
+    def __init__(self, path=ROUTE_STORE_PATH, ttl=ROUTE_SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                "token TEXT PRIMARY KEY, cities TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # Отдельное соединение на вызов: sqlite3-соединения нельзя делить между потоками
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def save(self, token, cities):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO routes (token, cities, updated_at) VALUES (?, ?, ?)",
+                (token, json.dumps(cities, ensure_ascii=False), now),
+            )
+            db.execute("DELETE FROM routes WHERE updated_at < ?", (now - self.ttl,))
+
+    def load(self, token):
+        if not token:
+            return []
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT cities FROM routes WHERE token = ? AND updated_at >= ?",
+                (token, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else []
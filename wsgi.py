@@ -0,0 +1,24 @@
+"""
+Точка входа для gunicorn:
+
+    gunicorn -w 4 -b 0.0.0.0:8000 wsgi:app
+
+Каждый воркер импортирует модуль сам (без --preload), поэтому фоновое обновление
+прогнозов запускается в каждом воркере, а не в мастер-процессе до fork.
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Воркеры делят кэши локаций и прогнозов через SQLite, если не задано иное;
+# настройка читается при импорте utls.main, поэтому задаётся до импорта приложения
+os.environ.setdefault("CACHE_BACKEND", "sqlite")
+
+from api.main import create_app  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+
+app = create_app()